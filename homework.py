@@ -1,14 +1,82 @@
-import logging
-import os
 import time
-from http import HTTPStatus
 
-import requests
-import telegram
-from dotenv import load_dotenv
+BOOT_STARTED = time.perf_counter()
 
+import atexit  # noqa: E402
+import bisect  # noqa: E402
+import contextlib  # noqa: E402
+import contextvars  # noqa: E402
+import copy  # noqa: E402
+import functools  # noqa: E402
+import hashlib  # noqa: E402
+import heapq  # noqa: E402
+import importlib  # noqa: E402
+import io  # noqa: E402
+import itertools  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import queue  # noqa: E402
+import random  # noqa: E402
+import signal  # noqa: E402
+import threading  # noqa: E402
+from collections import OrderedDict, namedtuple  # noqa: E402
+from concurrent.futures import Future, ThreadPoolExecutor, wait  # noqa: E402
+from http import HTTPStatus  # noqa: E402
+from logging.handlers import (QueueHandler, QueueListener,  # noqa: E402
+                              RotatingFileHandler, TimedRotatingFileHandler)
+from types import MappingProxyType  # noqa: E402
 
-load_dotenv()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+IMPORT_TIMES = {}
+
+
+class LazyModule:
+    """Модуль, который импортируется при первом обращении к атрибуту."""
+
+    def __init__(self, name):
+        """Запоминает имя модуля без импорта."""
+        self.name = name
+        self.module = None
+        self.lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        """Импортирует модуль при необходимости и отдаёт его атрибут."""
+        module = self.module
+        if module is None:
+            module = self.load()
+        return getattr(module, attribute)
+
+    def load(self):
+        """Импортирует модуль и записывает время импорта."""
+        with self.lock:
+            if self.module is None:
+                started = time.perf_counter()
+                self.module = importlib.import_module(self.name)
+                IMPORT_TIMES[self.name] = time.perf_counter() - started
+                logging.info(MODULE_IMPORTED.format(
+                    self.name, IMPORT_TIMES[self.name] * 1000))
+            return self.module
+
+
+requests = LazyModule('requests')
+telegram = LazyModule('telegram')
+urllib3_retry = LazyModule('urllib3.util.retry')
+asyncio = LazyModule('asyncio')
+multiprocessing = LazyModule('multiprocessing')
+http_server = LazyModule('http.server')
+sqlite3 = LazyModule('sqlite3')
+cProfile = LazyModule('cProfile')
+pstats = LazyModule('pstats')
+mmap = LazyModule('mmap')
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
 
 
 UNSUCCESSFUL_MESSAGE_SEND_WUTH_ERROR = ('Не удалось отправить сообщение "{}".'
@@ -21,9 +89,11 @@ ERROR_CHEK_RESPONSE = 'Ошибка типа овета: {}'
 KEY_HOMEWORK_IS_NOT = 'Ключ homeworks отсутствует'
 HOMEWORKS_LIST_TYPE = ('Неверный тип списка заданий.'
                        'Ожидался тип list, получен: {}')
+HOMEWORK_TYPE = 'Неверный тип работы. Ожидался тип dict, получен: {}'
 STATUS_HOMEWORK_VERDICT = 'не соответствует справочнику статусов {}'
 KEY_STATUS = 'Ключ status отсутствует в homework'
 KEY_HOMEWORK_NAME = 'Ключ homework_name отсутствует в homework'
+HOMEWORK_SKIPPED = 'Работа {} пропущена: {!r}'
 TOKEN_CHEK = 'Проверка токенов прошла успешно'
 HOMEWORK_FOR_PERIOD = 'Список работ за запрашиваемый период пустой'
 BOT_NOT_WORK = 'Сбой в работе бота: {}'
@@ -33,7 +103,40 @@ REQUEST_PARAMETRS = ('Ошибка {}. Эндпоинт {url} недоступе
                      'headers - {headers}, params - {params}.')
 REQUEST_STATUS_CODE = ('Неверный код {} returned from {url} '
                        'params: {params} - Headers: {headers}')
+REDACTED = '***'
 BOT_ERROR = 'Сбой в работе бота: {}!'
+ENGINE_STARTED = 'Запущен опрос подписок: {}'
+MESSAGE_DROPPED = 'Сообщение "{}" не доставлено после {} попыток'
+SEND_QUEUE_FULL = 'Очередь отправки переполнена, сообщение "{}" отброшено'
+METRICS_STARTED = 'Метрики доступны на порту {}'
+INGEST_STARTED = 'Приём статусов доступен на порту {}'
+INGEST_REJECTED = 'Отклонены присланные статусы: {}'
+SHARD_STARTED = 'Шард {} опрашивает подписок: {}'
+SHARD_DIED = 'Воркер шарда {} завершился с кодом {}, подписки перераспределены'
+SHARD_RESTARTED = 'Воркер шарда {} перезапущен'
+SHARD_HANDOFF_LATE = ('Не все шарды отдали подписки поколения {} за {} с, '
+                      'продолжаем без них')
+SHARD_CHECKPOINT_REQUIRED = ('Для нескольких воркеров нужен общий '
+                             'CHECKPOINT_DB')
+CIRCUIT_OPEN = 'Эндпоинт {} временно отключён после серии ошибок'
+UNKNOWN_LOCALE = 'Неизвестная локаль сообщений: {}'
+MODULE_IMPORTED = 'Модуль {} загружен за {:.1f} мс'
+STARTUP_REPORT = 'Время запуска: {}'
+CAPTURE_STARTED = 'Ответы API записываются в {}'
+REPLAY_FINISHED = 'Воспроизведено ответов: {}, сообщений: {}, ошибок: {}'
+DRY_RUN_SEND = 'Без отправки в чат {}: {}'
+PROFILE_STARTED = 'Профилирование следующих циклов: {}'
+PROFILE_SAVED = 'Профиль {} циклов сохранён в {}:\n{}'
+ERROR_SUMMARY = 'Сводка ошибок за {:.0f} с:\n{}'
+ERROR_SUMMARY_LINE = '{} ({}): {} раз, последняя: {}'
+CYCLE_HUNG = 'Цикл опроса {} не уложился в {} с и брошен'
+CYCLE_STILL_RUNNING = ('Брошенный цикл опроса {} всё ещё выполняется, '
+                       'новый цикл пропущен')
+CYCLE_TIMEOUT_TOO_SHORT = ('CYCLE_TIMEOUT={} с меньше времени запроса с '
+                           'повторами и отправки: {:.1f} с')
+POLL_SHED = 'Опрос подписки пропущен: {}'
+POLL_BUDGET_SPENT = 'Бюджет цикла исчерпан до запроса к {}'
+CHECKPOINTS_RESTORED = 'Восстановлено состояние подписок: {} за {:.3f} с'
 
 PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
@@ -43,6 +146,77 @@ RETRY_PERIOD = 600
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
 HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
 
+SUBSCRIPTIONS_FILE = os.getenv('SUBSCRIPTIONS_FILE')
+ENGINE_CONCURRENCY = int(os.getenv('ENGINE_CONCURRENCY', 64))
+SCHEDULER = os.getenv('SCHEDULER', 'adaptive')
+REVIEWING_PERIOD = int(os.getenv('REVIEWING_PERIOD', 120))
+IDLE_PERIOD = int(os.getenv('IDLE_PERIOD', 3600))
+IDLE_AFTER = int(os.getenv('IDLE_AFTER', 36))
+MAX_BACKOFF = int(os.getenv('MAX_BACKOFF', 3600))
+CHECKPOINT_DB = os.getenv('CHECKPOINT_DB')
+CHECKPOINT_BATCH = int(os.getenv('CHECKPOINT_BATCH', 100))
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', 5))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+SEND_RETRY_DELAY = float(os.getenv('SEND_RETRY_DELAY', 5))
+SEND_MAX_ATTEMPTS = int(os.getenv('SEND_MAX_ATTEMPTS', 5))
+SEND_TIMEOUT = float(os.getenv('SEND_TIMEOUT', 30))
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', 4))
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW', 0))
+TELEGRAM_MESSAGE_LIMIT = 4096
+SEND_QUEUE_SIZE = int(os.getenv('SEND_QUEUE_SIZE', 10000))
+MESSAGE_LOCALE = os.getenv('MESSAGE_LOCALE', 'ru')
+MESSAGE_CACHE_SIZE = int(os.getenv('MESSAGE_CACHE_SIZE', 4096))
+OPERATOR_CHAT_ID = os.getenv('OPERATOR_CHAT_ID')
+ERROR_QUIET_PERIOD = float(os.getenv('ERROR_QUIET_PERIOD', 600))
+ERROR_MAX_QUIET = float(os.getenv('ERROR_MAX_QUIET', 24 * 60 * 60))
+ERROR_SUMMARY_PERIOD = float(os.getenv('ERROR_SUMMARY_PERIOD', 60 * 60))
+DEDUP_SIZE = int(os.getenv('DEDUP_SIZE', 256))
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', 24 * 60 * 60))
+METRICS_PORT = os.getenv('METRICS_PORT')
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOG_FILE = os.getenv('LOG_FILE', __file__ + '.log')
+LOG_ROTATION = os.getenv('LOG_ROTATION', 'size')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+INGEST_PORT = os.getenv('INGEST_PORT')
+INGEST_RECONCILE_PERIOD = int(os.getenv('INGEST_RECONCILE_PERIOD', 3600))
+INGEST_MAX_BODY = 1024 * 1024
+WORKERS = int(os.getenv('WORKERS', 1))
+HASH_RING_REPLICAS = 100
+WHEEL_TICK = float(os.getenv('WHEEL_TICK', 1))
+WHEEL_SIZE = int(os.getenv('WHEEL_SIZE', 1024))
+WHEEL_JITTER = float(os.getenv('WHEEL_JITTER', 0.1))
+SHARD_CHECK_INTERVAL = 5
+SHARD_HANDOFF_POLL = 0.1
+SHARD_HANDOFF_TIMEOUT = float(os.getenv('SHARD_HANDOFF_TIMEOUT', 60))
+SHARD_RESTART_DELAY = float(os.getenv('SHARD_RESTART_DELAY', 10))
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 60))
+POLL_BUDGET = float(os.getenv('POLL_BUDGET', 30))
+PROFILE_CYCLES = int(os.getenv('PROFILE_CYCLES', 10))
+STAGE_METRICS = os.getenv('STAGE_METRICS', '0') == '1'
+PROFILE_DIR = os.getenv('PROFILE_DIR', '.')
+CAPTURE_FILE = os.getenv('CAPTURE_FILE')
+REPLAY_FILE = os.getenv('REPLAY_FILE')
+REPLAY_SPEED = float(os.getenv('REPLAY_SPEED', 60))
+REPLAY_LIVE = os.getenv('REPLAY_LIVE') == '1'
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+TELEGRAM_TIMEOUT = float(os.getenv('TELEGRAM_TIMEOUT', 20))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+HTTP_RETRY_BACKOFF = 0.3
+HTTP_REQUEST_LIMIT = min(
+    (HTTP_RETRIES + 1) * (HTTP_CONNECT_TIMEOUT + HTTP_READ_TIMEOUT),
+    POLL_BUDGET,
+) + HTTP_RETRY_BACKOFF * (2 ** HTTP_RETRIES - 1)
+CYCLE_TIMEOUT_FLOOR = HTTP_REQUEST_LIMIT + SEND_TIMEOUT
+CYCLE_TIMEOUT = float(os.getenv('CYCLE_TIMEOUT', CYCLE_TIMEOUT_FLOOR))
+
+SESSION = None
+CAPTURE = None
+
 
 HOMEWORK_VERDICTS = {
     'approved': 'Работа проверена: ревьюеру всё понравилось. Ура!',
@@ -50,6 +224,25 @@ HOMEWORK_VERDICTS = {
     'rejected': 'Работа проверена: у ревьюера есть замечания.'
 }
 
+LOCALES = {
+    'ru': {
+        'status': STATUS_HOMEWORK_MESSAGE,
+        'empty': HOMEWORK_FOR_PERIOD,
+        'error': BOT_ERROR,
+        'verdicts': HOMEWORK_VERDICTS,
+    },
+    'en': {
+        'status': 'Review status of homework "{}" has changed. {}',
+        'empty': 'No homeworks for the requested period',
+        'error': 'Bot failure: {}!',
+        'verdicts': {
+            'approved': 'The reviewer liked everything. Hooray!',
+            'reviewing': 'The homework has been taken for review.',
+            'rejected': 'The reviewer has left comments.',
+        },
+    },
+}
+
 TOKENS = {
     'PRACTICUM_TOKEN',
     'TELEGRAM_TOKEN',
@@ -57,6 +250,82 @@ TOKENS = {
 }
 
 
+json_loads = orjson.loads if orjson is not None else json.loads
+
+Homework = namedtuple('Homework', ('id', 'homework_name', 'status'))
+# Конструктор записи без Python-обёртки Homework.__new__: записи создаются
+# для каждой работы каждого ответа.
+new_homework = functools.partial(tuple.__new__, Homework)
+
+TENANT = contextvars.ContextVar('tenant', default=None)
+
+
+class TenantFilter(logging.Filter):
+    """Добавляет в запись лога подписку, которую сейчас обрабатывают."""
+
+    def filter(self, record):
+        """Дополняет запись полем tenant."""
+        record.tenant = TENANT.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует записи лога как JSON Lines."""
+
+    def format(self, record):
+        """Возвращает запись одной строкой JSON."""
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'tenant': getattr(record, 'tenant', None),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Кладёт запись в очередь, оставляя форматирование потоку записи."""
+
+    def prepare(self, record):
+        """Подставляет аргументы в сообщение, сохраняя exc_info."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(path=LOG_FILE, rotation=LOG_ROTATION,
+                      max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                      level=logging.INFO):
+    """Настраивает лог через очередь с записью на диск в фоновом потоке.
+
+    rotation: 'size' — ротация по размеру max_bytes, иначе значение when
+    для TimedRotatingFileHandler ('midnight', 'H' и т. п.).
+    """
+    if rotation == 'size':
+        file_handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8'
+        )
+    else:
+        file_handler = TimedRotatingFileHandler(
+            path, when=rotation, backupCount=backup_count, encoding='utf-8'
+        )
+    file_handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(TenantFilter())
+    listener = QueueListener(log_queue, file_handler,
+                             respect_handler_level=True)
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
 def check_tokens():
     """Проверка доступности токенов."""
     missing_tokens = [name for name in TOKENS if not globals()[name]]
@@ -65,45 +334,971 @@ def check_tokens():
         raise ValueError(TOKEN_CHEK)
 
 
-def send_message(bot, message):
-    """Отправляет сообщение в Telegram чат."""
+def check_cycle_timeout(timeout=CYCLE_TIMEOUT, floor=CYCLE_TIMEOUT_FLOOR):
+    """Проверяет, что сторож не бросает медленный, но рабочий цикл."""
+    if timeout < floor:
+        message = CYCLE_TIMEOUT_TOO_SHORT.format(timeout, floor)
+        logging.critical(message)
+        raise ValueError(message)
+
+
+class Metric:
+    """Метрика с метками в формате Prometheus."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, description):
+        """Создаёт метрику без значений."""
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def labels_key(labels):
+        """Ключ значения по набору меток."""
+        return tuple(sorted(labels.items()))
+
+    def key(self, labels):
+        """Ключ значения по набору меток, отсортированный один раз."""
+        items = tuple(labels.items())
+        key = self.keys.get(items)
+        if key is None:
+            key = self.keys[items] = self.labels_key(labels)
+        return key
+
+    @staticmethod
+    def format_labels(key, extra=()):
+        """Метки в текстовом формате Prometheus."""
+        pairs = [
+            '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+            for name, value in (*key, *extra)
+        ]
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self):
+        """Строки значений метрики."""
+        with self.lock:
+            items = list(self.values.items())
+        return [
+            f'{self.name}{self.format_labels(key)} {value}'
+            for key, value in items
+        ]
+
+    def render(self):
+        """Описание и значения метрики."""
+        return [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} {self.kind}',
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    """Монотонный счётчик."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Увеличивает счётчик."""
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Значение, которое может расти и убывать."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, description, callback=None):
+        """Создаёт шкалу; callback возвращает значения в момент сбора."""
+        super().__init__(name, description)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        """Устанавливает значение."""
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def samples(self):
+        """Строки значений метрики."""
+        if self.callback is None:
+            return super().samples()
+        return [
+            f'{self.name}{self.format_labels(self.labels_key(labels))} {value}'
+            for labels, value in self.callback()
+        ]
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        """Создаёт гистограмму с заданными границами корзин."""
+        super().__init__(name, description)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        """Учитывает наблюдение."""
+        self.record(self.key(labels), value)
+
+    def record(self, key, value):
+        """Учитывает наблюдение по готовому ключу меток.
+
+        Счётчики корзин хранятся без накопления и суммируются при сборе.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        """Строки значений метрики."""
+        with self.lock:
+            items = [
+                (key, list(itertools.accumulate(counts)), total)
+                for key, (counts, total) in self.values.items()
+            ]
+        lines = []
+        for key, counts, total in items:
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, self.format_labels(key, (('le', bound),)),
+                    count
+                ))
+            lines.append(f'{self.name}_sum{self.format_labels(key)} {total}')
+            lines.append(
+                f'{self.name}_count{self.format_labels(key)} {counts[-1]}'
+            )
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса."""
+
+    def __init__(self):
+        """Создаёт пустой реестр."""
+        self.metrics = []
+
+    def register(self, metric):
+        """Добавляет метрику в реестр."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+API_LATENCY = METRICS.register(Histogram(
+    'homework_api_request_seconds', 'Длительность запроса к API Практикума.'
+))
+SEND_LATENCY = METRICS.register(Histogram(
+    'homework_send_message_seconds', 'Длительность отправки в Telegram.'
+))
+CYCLE_ERRORS = METRICS.register(Counter(
+    'homework_cycle_errors_total', 'Ошибки цикла опроса по типу исключения.'
+))
+CYCLE_TIMEOUTS = METRICS.register(Counter(
+    'homework_cycle_timeouts_total', 'Циклы опроса, брошенные сторожем.'
+))
+HOMEWORKS_SKIPPED = METRICS.register(Counter(
+    'homework_skipped_total', 'Работы из ответа API, не прошедшие проверку.'
+))
+POLLS_SHED = METRICS.register(Counter(
+    'homework_polls_shed_total', 'Пропущенные опросы по причине.'
+))
+QUEUE_DEPTH = METRICS.register(Gauge(
+    'homework_queue_depth', 'Число заданий в очередях.'
+))
+LAST_POLL = {}
+METRICS.register(Gauge(
+    'homework_last_poll_age_seconds',
+    'Время с последнего успешного опроса подписки.',
+    callback=lambda: [
+        ({'tenant': key}, round(time.time() - moment, 3))
+        for key, moment in list(LAST_POLL.items())
+    ],
+))
+METRICS.register(Gauge(
+    'homework_import_seconds',
+    'Время импорта модулей при запуске.',
+    callback=lambda: [
+        ({'module': name}, round(seconds, 6))
+        for name, seconds in list(IMPORT_TIMES.items())
+    ],
+))
+STAGE_SECONDS = METRICS.register(Histogram(
+    'homework_stage_seconds',
+    'Время этапов цикла: настенное (wall) и процессорное (cpu).'
+))
+STAGE_KEYS = {}
+
+
+def record_stage(name, wall, cpu):
+    """Записывает время этапа в homework_stage_seconds."""
+    keys = STAGE_KEYS.get(name)
+    if keys is None:
+        keys = STAGE_KEYS[name] = (
+            STAGE_SECONDS.key({'stage': name, 'clock': 'wall'}),
+            STAGE_SECONDS.key({'stage': name, 'clock': 'cpu'}),
+        )
+    STAGE_SECONDS.record(keys[0], wall)
+    STAGE_SECONDS.record(keys[1], cpu)
+
+
+STAGE_HOOKS = [record_stage] if STAGE_METRICS else []
+
+
+class Stage:
+    """Замер одного этапа: настенное и процессорное время для хуков."""
+
+    __slots__ = ('name', 'wall', 'cpu')
+
+    def __init__(self, name):
+        """Готовит замер этапа name."""
+        self.name = name
+
+    def __enter__(self):
+        """Засекает время начала этапа."""
+        self.wall, self.cpu = time.perf_counter(), time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Передаёт хукам длительность этапа."""
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        for hook in STAGE_HOOKS:
+            hook(self.name, wall, cpu)
+
+
+NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name):
+    """Замеряет настенное и процессорное время этапа и передаёт хукам.
+
+    Без хуков возвращает пустой контекст и ничего не замеряет.
+    """
+    return Stage(name) if STAGE_HOOKS else NO_STAGE
+
+
+class Profiler:
+    """Окно профилирования cProfile на заданное число циклов.
+
+    request() открывает окно, обычно по сигналу SIGUSR1; по его окончании
+    статистика сохраняется в файл pstats и кратко пишется в лог.
+    """
+
+    def __init__(self, cycles=PROFILE_CYCLES, directory=PROFILE_DIR):
+        """Создаёт профилировщик без открытого окна."""
+        self.cycles = cycles
+        self.directory = directory
+        self.requested = False
+        self.remaining = 0
+        self.profile = None
+
+    def request(self, *args):
+        """Открывает окно на следующие cycles циклов."""
+        self.requested = True
+
+    @contextlib.contextmanager
+    def cycle(self):
+        """Профилирует цикл, если окно открыто."""
+        if self.requested and self.profile is None:
+            self.requested = False
+            self.remaining = self.cycles
+            self.profile = cProfile.Profile()
+            logging.info(PROFILE_STARTED.format(self.cycles))
+        if self.profile is None:
+            yield
+            return
+        self.profile.enable()
+        try:
+            yield
+        finally:
+            self.profile.disable()
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.dump()
+
+    def dump(self):
+        """Сохраняет статистику окна и закрывает его."""
+        path = os.path.join(
+            self.directory,
+            f'homework-{os.getpid()}-{int(time.time())}.pstats'
+        )
+        self.profile.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(self.profile, stream=report).sort_stats(
+            'cumulative'
+        ).print_stats(20)
+        logging.info(PROFILE_SAVED.format(self.cycles, path,
+                                          report.getvalue()))
+        self.profile = None
+        return path
+
+
+PROFILER = Profiler()
+
+
+@functools.lru_cache(maxsize=None)
+def http_handler(handler):
+    """Обработчик HTTP-сервера из класса handler с методами do_*.
+
+    http.server загружается только в режимах, где он нужен.
+    """
+    return type(handler.__name__,
+                (handler, http_server.BaseHTTPRequestHandler), {})
+
+
+class MetricsHandler:
+    """Отдаёт метрики по GET /metrics."""
+
+    def do_GET(self):
+        """Обрабатывает запрос метрик."""
+        if self.path != '/metrics':
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body = METRICS.render().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Не пишет в лог каждый сбор метрик."""
+
+
+def start_metrics_server(port, host=''):
+    """Запускает HTTP-сервер метрик в фоновом потоке."""
+    server = http_server.ThreadingHTTPServer((host, int(port)),
+                                             http_handler(MetricsHandler))
+    threading.Thread(
+        target=server.serve_forever, name='metrics', daemon=True
+    ).start()
+    logging.info(METRICS_STARTED.format(server.server_address[1]))
+    return server
+
+
+def send_to_chat(bot, chat_id, message):
+    """Отправляет сообщение в указанный чат Telegram."""
     try:
-        bot.send_message(TELEGRAM_CHAT_ID, message)
+        started = time.monotonic()
+        with stage('send_message'):
+            bot.send_message(chat_id, message, timeout=TELEGRAM_TIMEOUT)
+        SEND_LATENCY.observe(time.monotonic() - started)
         logging.debug(SUCCESSFUL_MESSAGE_SEND.format(message))
         return True
     except Exception as error:
-        logging.exception(
-            logging.debug(UNSUCCESSFUL_MESSAGE_SEND_WUTH_ERROR .format(
-                message, error))
-        )
+        logging.exception(UNSUCCESSFUL_MESSAGE_SEND_WUTH_ERROR.format(
+            message, error))
         return False
 
 
-def get_api_answer(timestamp):
-    """Запрос к эндпоинту API-сервиса."""
-    request_parameters = {
-        'url': ENDPOINT,
-        'headers': HEADERS,
-        'params': {'from_date': timestamp}
+def send_message(bot, message):
+    """Отправляет сообщение в Telegram чат."""
+    return send_to_chat(bot, TELEGRAM_CHAT_ID, message)
+
+
+def route_message(bot, chat_id, message):
+    """Отправляет сообщение в чат; основной чат — через send_message."""
+    if str(chat_id) == str(TELEGRAM_CHAT_ID):
+        return send_message(bot, message)
+    return send_to_chat(bot, chat_id, message)
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity.
+
+    При rate=0 частота не ограничивается.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """Создаёт полный бакет."""
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        """Возвращает, сколько секунд ждать до появления токена."""
+        if not self.rate:
+            return 0
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """Забирает токен."""
+        self.tokens -= 1
+
+
+class SendJob:
+    """Сообщение в очереди отправки."""
+
+    def __init__(self, chat_id, text):
+        """Создаёт задание без попыток отправки."""
+        self.chat_id = chat_id
+        self.text = text
+        self.attempts = 0
+        self.future = Future()
+        self.tenant = TENANT.get()
+
+
+class SendQueue:
+    """Очередь исходящих сообщений с ограничением частоты по чатам и боту."""
+
+    def __init__(self, send, chat_rate=TELEGRAM_CHAT_RATE,
+                 global_rate=TELEGRAM_GLOBAL_RATE,
+                 retry_delay=SEND_RETRY_DELAY,
+                 max_attempts=SEND_MAX_ATTEMPTS,
+                 workers=SEND_WORKERS, maxsize=SEND_QUEUE_SIZE):
+        """Принимает функцию отправки send(chat_id, text) -> bool."""
+        self.send = send
+        self.workers = workers
+        self.maxsize = maxsize
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.global_bucket = TokenBucket(global_rate)
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.heap = []
+        self.counter = itertools.count()
+        self.fresh = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.threads = []
+
+    def __len__(self):
+        """Число сообщений, ожидающих отправки."""
+        with self.condition:
+            return len(self.heap)
+
+    def start(self):
+        """Запускает потоки отправки."""
+        self.running = True
+        self.threads = [
+            threading.Thread(
+                target=self._run, name=f'send-queue-{index}', daemon=True
+            )
+            for index in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает потоки отправки."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def put(self, chat_id, text, timeout=SEND_TIMEOUT):
+        """Ставит сообщение в очередь и возвращает Future с итогом доставки.
+
+        При переполненной очереди ждёт освобождения места не дольше timeout.
+        """
+        job = SendJob(chat_id, text)
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: len(self.heap) < self.maxsize, timeout
+            ):
+                logging.error(SEND_QUEUE_FULL.format(text))
+                job.future.set_result(False)
+                return job.future
+            self.fresh += 1
+            self._push(time.monotonic(), job)
+            self.condition.notify_all()
+        return job.future
+
+    def drain(self, timeout=None):
+        """Ждёт первой попытки отправки всех новых сообщений."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.fresh, timeout)
+
+    def _push(self, ready_at, job):
+        heapq.heappush(self.heap, (ready_at, next(self.counter), job))
+        QUEUE_DEPTH.set(len(self.heap), queue='send')
+
+    def _throttle(self, job, now):
+        bucket = self.chat_buckets.get(job.chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[job.chat_id] = TokenBucket(
+                self.chat_rate, capacity=1
+            )
+        wait = max(bucket.delay(now), self.global_bucket.delay(now))
+        if not wait:
+            bucket.consume()
+            self.global_bucket.consume()
+        return wait
+
+    def _next_job(self):
+        with self.condition:
+            while self.running:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                now = time.monotonic()
+                ready_at, _, job = self.heap[0]
+                if ready_at > now:
+                    self.condition.wait(ready_at - now)
+                    continue
+                heapq.heappop(self.heap)
+                QUEUE_DEPTH.set(len(self.heap), queue='send')
+                wait = self._throttle(job, now)
+                if not wait:
+                    return job
+                self._push(now + wait, job)
+        return None
+
+    def _attempt(self, job):
+        TENANT.set(job.tenant)
+        job.attempts += 1
+        try:
+            delivered = self.send(job.chat_id, job.text)
+        except Exception as error:
+            logging.exception(UNSUCCESSFUL_MESSAGE_SEND_WUTH_ERROR.format(
+                job.text, error))
+            delivered = False
+        with self.condition:
+            if job.attempts == 1:
+                self.fresh -= 1
+            if not delivered and job.attempts < self.max_attempts:
+                self._push(
+                    time.monotonic()
+                    + self.retry_delay * 2 ** (job.attempts - 1),
+                    job
+                )
+            self.condition.notify_all()
+        if delivered:
+            job.future.set_result(True)
+        elif job.attempts >= self.max_attempts:
+            logging.error(MESSAGE_DROPPED.format(job.text, job.attempts))
+            job.future.set_result(False)
+
+    def _run(self):
+        job = self._next_job()
+        while job is not None:
+            self._attempt(job)
+            job = self._next_job()
+
+
+class Digest:
+    """Собирает сообщения чата за окно window в одно сообщение.
+
+    При window=0 сообщения передаются в send сразу, без сборки.
+    """
+
+    def __init__(self, send, window=DIGEST_WINDOW,
+                 limit=TELEGRAM_MESSAGE_LIMIT):
+        """Принимает функцию отправки send(chat_id, text) -> Future."""
+        self.send = send
+        self.window = window
+        self.limit = limit
+        self.buffers = {}
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Запускает поток, отправляющий сводки по истечении окна."""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='digest',
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Отправляет накопленное и останавливает поток."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.flush()
+
+    def put(self, chat_id, text):
+        """Добавляет сообщение в сводку чата, возвращает Future доставки."""
+        if not self.window:
+            return as_future(self.send(chat_id, text))
+        future = Future()
+        with self.condition:
+            if chat_id not in self.buffers:
+                self.buffers[chat_id] = (time.monotonic(), [])
+            self.buffers[chat_id][1].append((text, future))
+            self.condition.notify_all()
+        return future
+
+    def flush(self, due_before=None):
+        """Отправляет сводки чатов, окно которых открылось до due_before.
+
+        Без due_before отправляет все накопленные сводки.
+        """
+        with self.condition:
+            chats = [
+                chat_id for chat_id, (opened, _) in self.buffers.items()
+                if due_before is None or opened <= due_before
+            ]
+            batches = [(chat_id, self.buffers.pop(chat_id)[1])
+                       for chat_id in chats]
+        for chat_id, items in batches:
+            for text, futures in self.chunks(items, self.limit):
+                as_future(self.send(chat_id, text)).add_done_callback(
+                    lambda done, futures=futures: [
+                        future.set_result(bool(done.result()))
+                        for future in futures
+                    ]
+                )
+
+    @staticmethod
+    def chunks(items, limit):
+        """Склеивает тексты в сообщения не длиннее limit символов."""
+        texts, futures, size = [], [], 0
+        for text, future in items:
+            text = text[:limit]
+            if texts and size + 2 + len(text) > limit:
+                yield '\n\n'.join(texts), futures
+                texts, futures, size = [], [], 0
+            size += len(text) + (2 if texts else 0)
+            texts.append(text)
+            futures.append(future)
+        if texts:
+            yield '\n\n'.join(texts), futures
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                if not self.buffers:
+                    self.condition.wait()
+                    continue
+                opened = min(opened for opened, _ in self.buffers.values())
+                wait = opened + self.window - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+            self.flush(time.monotonic() - self.window)
+
+
+REQUEST_BUDGET = threading.local()
+
+
+def create_retry(retries):
+    """Повторы urllib3, число которых ограничено бюджетом текущего цикла.
+
+    request_statuses кладёт в REQUEST_BUDGET.retries, сколько повторов
+    укладывается в оставшийся бюджет потока.
+    """
+    class BudgetRetry(urllib3_retry.Retry):
+        """Retry, исчерпывающийся вместе с бюджетом цикла."""
+
+        def is_exhausted(self):
+            """Исчерпаны ли повторы или бюджет цикла."""
+            allowed = getattr(REQUEST_BUDGET, 'retries', None)
+            return super().is_exhausted() or (
+                allowed is not None and len(self.history) > allowed
+            )
+
+    return BudgetRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=0,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+    )
+
+
+def create_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES):
+    """Создаёт сессию с пулом keep-alive соединений к эндпоинту."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=create_retry(retries),
+    )
+    session.mount(ENDPOINT, adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def configure_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES):
+    """Подключает общую сессию, которой пользуется get_api_answer."""
+    global SESSION
+    SESSION = create_session(pool_size, retries)
+    return SESSION
+
+
+class CaptureWriter:
+    """Дописывает ответы API в файл JSON Lines для воспроизведения."""
+
+    def __init__(self, path):
+        """Открывает файл записи на дозапись."""
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def write(self, from_date, elapsed, response):
+        """Записывает ответ с параметром from_date и временем запроса."""
+        line = json.dumps({
+            'at': round(time.time(), 3),
+            'tenant': TENANT.get(),
+            'from_date': from_date,
+            'elapsed': round(elapsed, 6),
+            'response': response,
+        }, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        """Закрывает файл записи."""
+        with self.lock:
+            self.file.close()
+
+
+def configure_capture(path=CAPTURE_FILE):
+    """Включает запись ответов API, если задан CAPTURE_FILE."""
+    global CAPTURE
+    if path:
+        CAPTURE = CaptureWriter(path)
+        atexit.register(CAPTURE.close)
+        logging.info(CAPTURE_STARTED.format(path))
+    return CAPTURE
+
+
+def record_capture(from_date, elapsed, response):
+    """Записывает ответ API, если запись включена."""
+    if CAPTURE is not None:
+        CAPTURE.write(from_date, elapsed, response)
+
+
+def decode_json(response):
+    """Декодирует тело ответа, минуя response.json(), если оно в байтах."""
+    body = getattr(response, 'content', None)
+    if isinstance(body, bytes):
+        return json_loads(body)
+    return response.json()
+
+
+class CircuitOpenError(ConnectionError):
+    """Запрос не отправлен: предохранитель эндпоинта разомкнут."""
+
+
+class StatusCodeError(ValueError):
+    """Эндпоинт ответил неожиданным кодом."""
+
+    def __init__(self, message, status_code):
+        """Запоминает код ответа рядом с текстом ошибки."""
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def describe_error(error):
+    """Описание ошибки без её текста: тип, код ответа или причина.
+
+    Текст ошибок запроса содержит параметры запроса, поэтому в общие
+    для процесса сводки попадает только это описание.
+    """
+    description = type(error).__name__
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return f'{description} {status_code}'
+    if error.__cause__ is not None:
+        return f'{description} ({type(error.__cause__).__name__})'
+    return description
+
+
+class CircuitBreaker:
+    """Предохранитель эндпоинта: закрыт, разомкнут или полуоткрыт.
+
+    После failures ошибок подряд размыкается и отклоняет запросы
+    reset_timeout секунд, затем пропускает один пробный запрос.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failures=BREAKER_FAILURES,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        """Создаёт замкнутый предохранитель."""
+        self.threshold = failures
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Можно ли отправить запрос."""
+        with self.lock:
+            if (self.state == self.OPEN
+                    and time.monotonic() - self.opened_at
+                    >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        """Учитывает успешный запрос."""
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def release(self):
+        """Отпускает пробный запрос, не дошедший до эндпоинта."""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        """Учитывает неудачный запрос."""
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+BREAKERS = {}
+BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(endpoint):
+    """Общий предохранитель эндпоинта."""
+    with BREAKERS_LOCK:
+        if endpoint not in BREAKERS:
+            BREAKERS[endpoint] = CircuitBreaker()
+        return BREAKERS[endpoint]
+
+
+class Deadline:
+    """Бюджет времени на один цикл опроса."""
+
+    def __init__(self, budget):
+        """Начинает отсчёт бюджета в budget секунд."""
+        self.expires = time.monotonic() + budget
+
+    def remaining(self):
+        """Оставшееся время в секундах, не меньше нуля."""
+        return max(0, self.expires - time.monotonic())
+
+    def expired(self):
+        """Исчерпан ли бюджет."""
+        return self.remaining() == 0
+
+
+def redact_headers(headers):
+    """Заголовки запроса без значения токена для текстов ошибок."""
+    return {
+        name: REDACTED if name.lower() == 'authorization' else value
+        for name, value in headers.items()
     }
+
+
+def request_timeout(deadline=None):
+    """Таймауты запроса и число повторов, укладывающиеся в бюджет.
+
+    Таймауты попытки пропорционально урезаются до половины остатка, так
+    что кроме первой попытки в бюджет всегда помещается хотя бы один
+    повтор. Без бюджета число повторов не ограничивается (None).
+    """
+    timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    if deadline is None:
+        return timeout, None
+    remaining = deadline.remaining()
+    if not remaining:
+        raise TimeoutError(POLL_BUDGET_SPENT.format(ENDPOINT))
+    share = min(1, remaining / 2 / sum(timeout))
+    timeout = tuple(limit * share for limit in timeout)
+    return timeout, max(1, int(remaining // sum(timeout)) - 1)
+
+
+def send_request(breaker, request_parameters, described):
+    """Отправляет запрос к API, возвращает ответ и его длительность.
+
+    Сетевая ошибка учитывается предохранителем; прочие исключения
+    отпускают пробный запрос, чтобы предохранитель не завис.
+    """
+    http = requests if SESSION is None else SESSION
+    started = time.monotonic()
     try:
-        response = requests.get(**request_parameters)
+        return http.get(**request_parameters), time.monotonic() - started
     except requests.exceptions.RequestException as error:
-        raise ConnectionError(REQUEST_PARAMETRS.format(
-            error, **request_parameters))
+        breaker.record_failure()
+        raise ConnectionError(
+            REQUEST_PARAMETRS.format(error, **described)
+        ) from error
+    except BaseException:
+        breaker.release()
+        raise
+    finally:
+        API_LATENCY.observe(time.monotonic() - started)
+
+
+def request_statuses(timestamp, headers, deadline=None):
+    """Запрос статусов работ с заголовками конкретного токена.
+
+    Если передан deadline, таймауты и повторы запроса не выходят за
+    оставшийся бюджет цикла.
+    """
+    timeout, REQUEST_BUDGET.retries = request_timeout(deadline)
+    breaker = get_breaker(ENDPOINT)
+    if not breaker.allow():
+        raise CircuitOpenError(CIRCUIT_OPEN.format(ENDPOINT))
+    request_parameters = {
+        'url': ENDPOINT,
+        'headers': headers,
+        'params': {'from_date': timestamp},
+        'timeout': timeout,
+    }
+    described = dict(request_parameters, headers=redact_headers(
+        request_parameters['headers']
+    ))
+    response, elapsed = send_request(breaker, request_parameters, described)
+    if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
     if response.status_code != HTTPStatus.OK:
-        raise ValueError(REQUEST_STATUS_CODE.format(
-            response.status_code, **request_parameters)
-        )
-    api_response = response.json()
+        raise StatusCodeError(REQUEST_STATUS_CODE.format(
+            response.status_code, **described
+        ), response.status_code)
+    api_response = decode_json(response)
+    record_capture(timestamp, elapsed, api_response)
     for key in ('code', 'error'):
         if key in api_response:
             raise ValueError(API_ERROR.format(
-                api_response[key], key, **request_parameters
+                api_response[key], key, **described
             ))
     return api_response
 
 
+def get_api_answer(timestamp):
+    """Запрос к эндпоинту API-сервиса."""
+    return request_statuses(timestamp, HEADERS)
+
+
 def check_response(response):
     """Проверка ответа API на корректность."""
     if not isinstance(response, dict):
@@ -113,58 +1308,1402 @@ def check_response(response):
         raise KeyError(KEY_HOMEWORK_IS_NOT)
     if not isinstance(homeworks, list):
         raise TypeError(HOMEWORKS_LIST_TYPE.format(type(homeworks)))
-    return homeworks
+    records = []
+    for homework in homeworks:
+        try:
+            records.append(validate_homework(homework))
+        except (TypeError, KeyError, ValueError) as error:
+            HOMEWORKS_SKIPPED.inc()
+            logging.warning(HOMEWORK_SKIPPED.format(homework, error))
+    return records
 
 
-def parse_status(homework):
-    """Извлекает статус работы."""
+def validate_homework(homework):
+    """Проверяет работу из ответа API и возвращает запись Homework."""
+    if isinstance(homework, Homework):
+        return homework
+    try:
+        status = homework['status']
+        if status in HOMEWORK_VERDICTS:
+            return new_homework(
+                (homework.get('id'), homework['homework_name'], status)
+            )
+    except (TypeError, KeyError, AttributeError):
+        pass
+    raise homework_error(homework)
+
+
+def homework_error(homework):
+    """Исключение, описывающее, почему работа не прошла проверку."""
+    if not isinstance(homework, dict):
+        return TypeError(HOMEWORK_TYPE.format(type(homework)))
     if 'status' not in homework:
-        raise KeyError(KEY_STATUS)
+        return KeyError(KEY_STATUS)
     if 'homework_name' not in homework:
-        raise KeyError(KEY_HOMEWORK_NAME)
-    status = homework.get('status')
-    if status not in HOMEWORK_VERDICTS:
-        raise ValueError(STATUS_HOMEWORK_VERDICT.format(status))
-    return STATUS_HOMEWORK_MESSAGE.format(homework.get('homework_name'),
-                                          HOMEWORK_VERDICTS[status])
+        return KeyError(KEY_HOMEWORK_NAME)
+    return ValueError(STATUS_HOMEWORK_VERDICT.format(homework['status']))
+
+
+class Messages:
+    """Шаблоны сообщений одной локали с переопределёнными вердиктами.
+
+    Готовые тексты о статусах запоминаются по (status, homework_name),
+    так что подписки с одинаковыми настройками делят один кэш.
+    """
+
+    def __init__(self, templates, verdicts=None,
+                 maxsize=MESSAGE_CACHE_SIZE):
+        """Связывает шаблоны локали и вердикты."""
+        self.verdicts = MappingProxyType(
+            {**templates['verdicts'], **(verdicts or {})}
+        )
+        self.empty = templates['empty']
+        self.format_status = templates['status'].format
+        self.format_error = templates['error'].format
+        self.render_status = functools.lru_cache(maxsize)(self.render)
+
+    def render(self, status, homework_name):
+        """Текст о статусе status работы homework_name без кэша."""
+        return self.format_status(homework_name, self.verdicts[status])
+
+    def status(self, homework):
+        """Сообщение о новом статусе работы."""
+        return self.render_status(homework.status, homework.homework_name)
+
+    def error(self, error):
+        """Сообщение о сбое в работе бота."""
+        return self.format_error(error)
+
+
+class MessageCatalog:
+    """Каталог сообщений по локалям и переопределениям вердиктов."""
+
+    def __init__(self, locales=LOCALES, default_locale=MESSAGE_LOCALE,
+                 maxsize=MESSAGE_CACHE_SIZE):
+        """Создаёт пустой каталог над шаблонами locales."""
+        self.locales = locales
+        self.default_locale = default_locale
+        self.maxsize = maxsize
+        self.bundles = {}
+        self.default_key = (default_locale, frozenset())
+        self.lock = threading.Lock()
+
+    def messages(self, locale=None, verdicts=None):
+        """Общие для подписок шаблоны локали с вердиктами verdicts."""
+        key = self.default_key
+        if locale is not None or verdicts:
+            key = (locale or self.default_locale,
+                   frozenset((verdicts or {}).items()))
+        bundle = self.bundles.get(key)
+        if bundle is not None:
+            return bundle
+        locale = key[0]
+        if locale not in self.locales:
+            raise ValueError(UNKNOWN_LOCALE.format(locale))
+        with self.lock:
+            if key not in self.bundles:
+                self.bundles[key] = Messages(self.locales[locale], verdicts,
+                                             self.maxsize)
+            return self.bundles[key]
+
+
+CATALOG = MessageCatalog()
+
+
+def parse_status(homework):
+    """Извлекает статус работы."""
+    homework = validate_homework(homework)
+    return CATALOG.messages().status(homework)
+
+
+class FixedScheduler:
+    """Опрос через постоянный период."""
+
+    def __init__(self, period=RETRY_PERIOD):
+        """Запоминает период опроса."""
+        self.period = period
+
+    def record(self, homeworks=None, error=None):
+        """Учитывает результат цикла опроса."""
+
+    def next_delay(self):
+        """Возвращает паузу до следующего опроса в секундах."""
+        return self.period
+
+
+class AdaptiveScheduler(FixedScheduler):
+    """Период опроса, зависящий от статуса работ и ошибок API."""
+
+    def __init__(self, period=RETRY_PERIOD, reviewing_period=REVIEWING_PERIOD,
+                 idle_period=IDLE_PERIOD, idle_after=IDLE_AFTER,
+                 max_backoff=MAX_BACKOFF):
+        """Задаёт периоды для проверки, простоя и отката после ошибок."""
+        super().__init__(period)
+        self.reviewing_period = reviewing_period
+        self.idle_period = idle_period
+        self.idle_after = idle_after
+        self.max_backoff = max_backoff
+        self.reviewing = False
+        self.idle_cycles = 0
+        self.failures = 0
+
+    def record(self, homeworks=None, error=None):
+        """Учитывает результат цикла опроса."""
+        if isinstance(error, (ConnectionError, ValueError)):
+            self.failures += 1
+            return
+        self.failures = 0
+        if homeworks:
+            self.idle_cycles = 0
+            self.reviewing = any(
+                homework.status == 'reviewing' for homework in homeworks
+            )
+        elif error is None and not self.reviewing:
+            self.idle_cycles += 1
+
+    def next_delay(self):
+        """Возвращает паузу до следующего опроса в секундах."""
+        if self.failures:
+            backoff = min(self.period * 2 ** (self.failures - 1),
+                          self.max_backoff)
+            return random.uniform(backoff / 2, backoff)
+        if self.reviewing:
+            return self.reviewing_period
+        if self.idle_cycles >= self.idle_after:
+            return self.idle_period
+        return self.period
+
+
+SCHEDULERS = {
+    'fixed': FixedScheduler,
+    'adaptive': AdaptiveScheduler,
+}
+
+
+class StatusIndex:
+    """Последние известные статусы работ по id или названию."""
+
+    def __init__(self):
+        """Создаёт пустой индекс."""
+        self.statuses = {}
+        self.reserved = {}
+
+    @staticmethod
+    def key(homework):
+        """Ключ работы в индексе."""
+        if homework.id is not None:
+            return homework.id
+        return homework.homework_name
+
+    def changes(self, homeworks):
+        """Возвращает работы, статус которых отличается от известного."""
+        return [
+            homework for homework in homeworks
+            if self.known(homework) != homework.status
+        ]
+
+    def known(self, homework):
+        """Статус работы с учётом ещё не доставленных уведомлений."""
+        key = self.key(homework)
+        return self.reserved.get(key, self.statuses.get(key))
+
+    def reserve(self, homework):
+        """Помечает статус работы как отправляемый."""
+        self.reserved[self.key(homework)] = homework.status
+
+    def release(self, homework):
+        """Снимает пометку после неудачной доставки."""
+        self.reserved.pop(self.key(homework), None)
+
+    def commit(self, homework):
+        """Запоминает статус работы после доставки уведомления."""
+        key = self.key(homework)
+        self.reserved.pop(key, None)
+        self.statuses[key] = homework.status
+
+
+class DedupCache:
+    """Отпечатки отправленных сообщений подписки с TTL и вытеснением LRU."""
+
+    def __init__(self, maxsize=DEDUP_SIZE, ttl=DEDUP_TTL):
+        """Создаёт пустой кэш на maxsize отпечатков."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def fingerprint(message):
+        """Отпечаток текста сообщения."""
+        return hashlib.blake2b(message.encode(),
+                               digest_size=8).hexdigest()
+
+    def __contains__(self, message):
+        """Отправлялось ли сообщение в пределах TTL."""
+        key = self.fingerprint(message)
+        expires = self.entries.get(key)
+        if expires is None:
+            return False
+        if expires <= time.time():
+            del self.entries[key]
+            return False
+        self.entries.move_to_end(key)
+        return True
+
+    def __len__(self):
+        """Количество хранимых отпечатков."""
+        return len(self.entries)
+
+    def add(self, message):
+        """Запоминает сообщение на ttl секунд."""
+        key = self.fingerprint(message)
+        self.entries[key] = time.time() + self.ttl
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def discard(self, message):
+        """Забывает сообщение, например после неудачной доставки."""
+        self.entries.pop(self.fingerprint(message), None)
+
+    def dumps(self):
+        """Сериализует неистёкшие отпечатки для хранилища."""
+        now = time.time()
+        return json.dumps([
+            [key, expires] for key, expires in self.entries.items()
+            if expires > now
+        ])
+
+    def loads(self, value):
+        """Восстанавливает отпечатки из строки хранилища.
+
+        Строка старого формата считается текстом последнего сообщения.
+        """
+        if not value:
+            return
+        try:
+            entries = json.loads(value)
+        except ValueError:
+            self.add(value)
+            return
+        for key, expires in entries[-self.maxsize:]:
+            self.entries[key] = expires
+
+
+class ErrorGroup:
+    """Счётчики и период тишины одной группы ошибок."""
+
+    def __init__(self, quiet):
+        """Создаёт пустую группу с начальным периодом тишины."""
+        self.count = 0
+        self.last = ''
+        self.quiet = quiet
+        self.until = 0
+
+
+class ErrorAggregator:
+    """Ошибки, сгруппированные по типу исключения и эндпоинту.
+
+    После уведомления повторы группы замалчиваются на период тишины,
+    который удваивается до max_quiet и сбрасывается, если группа молчала
+    целый период. Сводка со счётчиками готова не чаще раза в
+    summary_period.
+    """
+
+    def __init__(self, quiet=ERROR_QUIET_PERIOD, max_quiet=ERROR_MAX_QUIET,
+                 summary_period=ERROR_SUMMARY_PERIOD):
+        """Создаёт агрегатор без ошибок."""
+        self.quiet = quiet
+        self.max_quiet = max_quiet
+        self.summary_period = summary_period
+        self.groups = {}
+        self.summarized_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, error, endpoint=ENDPOINT):
+        """Учитывает ошибку; True, если о ней пора сообщить."""
+        now = time.monotonic()
+        with self.lock:
+            group = self.groups.setdefault((type(error).__name__, endpoint),
+                                           ErrorGroup(self.quiet))
+            group.count += 1
+            group.last = describe_error(error)
+            if now < group.until:
+                return False
+            if now >= group.until + group.quiet:
+                group.quiet = self.quiet
+            group.until = now + group.quiet
+            group.quiet = min(group.quiet * 2, self.max_quiet)
+            return True
+
+    def summary(self):
+        """Текст сводки, если её период прошёл и ошибки были."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.summarized_at < self.summary_period:
+                return None
+            lines = [
+                ERROR_SUMMARY_LINE.format(name, endpoint, group.count,
+                                          group.last)
+                for (name, endpoint), group in self.groups.items()
+                if group.count
+            ]
+            period = now - self.summarized_at
+            self.summarized_at = now
+            for group in self.groups.values():
+                group.count = 0
+        if not lines:
+            return None
+        return ERROR_SUMMARY.format(period, '\n'.join(lines))
+
+
+ERRORS = ErrorAggregator()
+
+
+def report_errors(send):
+    """Отправляет готовую сводку ошибок в OPERATOR_CHAT_ID или в лог."""
+    text = ERRORS.summary()
+    if text is None:
+        return
+    if OPERATOR_CHAT_ID:
+        send(OPERATOR_CHAT_ID, text)
+    else:
+        logging.warning(text)
+
+
+class Tenant:
+    """Подписка: токен Практикума, чат Telegram и состояние опроса."""
+
+    def __init__(self, token, chat_id, timestamp=None, scheduler=None,
+                 messages=None):
+        """Создаёт подписку с начальной временной меткой."""
+        self.token = token
+        self.chat_id = chat_id
+        self.headers = {'Authorization': f'OAuth {token}'}
+        self.timestamp = int(time.time()) if timestamp is None else timestamp
+        self.sent = DedupCache()
+        self.errors = ErrorAggregator()
+        self.scheduler = scheduler or SCHEDULERS[SCHEDULER]()
+        self.statuses = StatusIndex()
+        self.messages = messages or CATALOG.messages()
+        self.pending = []
+        self.lock = threading.Lock()
+
+    @property
+    def feed(self):
+        """Ключ токена: подписки с общим токеном опрашиваются вместе."""
+        return hashlib.sha256(self.token.encode()).hexdigest()[:16]
+
+    @property
+    def key(self):
+        """Ключ подписки для хранилища без токена в открытом виде."""
+        return f'{self.chat_id}:{self.feed}'
+
+
+class CheckpointStore:
+    """Хранилище метки времени и отправленных сообщений подписок в SQLite."""
+
+    def __init__(self, path, batch_size=CHECKPOINT_BATCH,
+                 interval=CHECKPOINT_INTERVAL):
+        """Открывает базу в режиме WAL и создаёт таблицу."""
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS checkpoints ('
+            'key TEXT PRIMARY KEY, timestamp INTEGER, last_message TEXT)'
+        )
+        self.connection.commit()
+
+    def load_all(self):
+        """Возвращает сохранённые состояния всех подписок."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT key, timestamp, last_message FROM checkpoints'
+            ).fetchall()
+        return {key: (timestamp, message) for key, timestamp, message in rows}
+
+    def restore(self, tenants):
+        """Восстанавливает состояние подписок из базы."""
+        started = time.monotonic()
+        checkpoints = self.load_all()
+        restored = 0
+        for tenant in tenants:
+            if tenant.key in checkpoints:
+                tenant.timestamp, sent = checkpoints[tenant.key]
+                tenant.sent.loads(sent)
+                restored += 1
+        logging.info(CHECKPOINTS_RESTORED.format(
+            restored, time.monotonic() - started))
+
+    def save(self, tenant):
+        """Ставит состояние подписки в очередь на запись."""
+        with self.lock:
+            self.pending[tenant.key] = (tenant.timestamp, tenant.sent.dumps())
+            QUEUE_DEPTH.set(len(self.pending), queue='checkpoint')
+            due = (
+                len(self.pending) >= self.batch_size
+                or time.monotonic() - self.flushed_at >= self.interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные состояния одной транзакцией."""
+        with self.lock:
+            rows = [
+                (key, timestamp, message)
+                for key, (timestamp, message) in self.pending.items()
+            ]
+            self.pending.clear()
+            QUEUE_DEPTH.set(0, queue='checkpoint')
+            self.flushed_at = time.monotonic()
+            if rows:
+                with self.connection:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO checkpoints '
+                        '(key, timestamp, last_message) VALUES (?, ?, ?)',
+                        rows
+                    )
+
+    def close(self):
+        """Сбрасывает очередь записи и закрывает базу."""
+        self.flush()
+        self.connection.close()
+
+
+def open_checkpoint_store():
+    """Открывает хранилище состояния, если задан CHECKPOINT_DB."""
+    return CheckpointStore(CHECKPOINT_DB) if CHECKPOINT_DB else None
+
+
+def load_subscriptions(path):
+    """Загружает подписки из файла JSON Lines.
+
+    Необязательные поля locale и verdicts задают язык сообщений и свои
+    тексты вердиктов подписки. В chat_id можно передать список чатов:
+    токен опрашивается один раз, уведомления уходят в каждый чат.
+    """
+    tenants = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                chat_ids = record['chat_id']
+                if not isinstance(chat_ids, list):
+                    chat_ids = [chat_ids]
+                messages = CATALOG.messages(record.get('locale'),
+                                            record.get('verdicts'))
+                tenants.extend(
+                    Tenant(record['token'], str(chat_id), messages=messages)
+                    for chat_id in chat_ids
+                )
+    return tenants
+
+
+def collect_messages(tenant, homeworks):
+    """Сообщения о переходах статусов за один проход по ответу."""
+    if not homeworks:
+        return [(None, tenant.messages.empty)]
+    with stage('parse_status'):
+        return [
+            (homework, tenant.messages.status(homework))
+            for homework in tenant.statuses.changes(homeworks)
+        ]
+
+
+def as_future(result):
+    """Приводит результат функции отправки к Future."""
+    if isinstance(result, Future):
+        return result
+    future = Future()
+    future.set_result(bool(result))
+    return future
+
+
+def deliver(tenant, send, messages):
+    """Ставит сообщения подписки в отправку, возвращает задания.
+
+    Сообщения без работы (ошибки, пустой ответ) отправляются не чаще
+    раза за DEDUP_TTL; повторы переходов статусов отсекает StatusIndex.
+    """
+    jobs = []
+    for homework, message in messages:
+        if homework is None:
+            if message in tenant.sent:
+                continue
+            tenant.sent.add(message)
+        else:
+            tenant.statuses.reserve(homework)
+        jobs.append((message, homework, as_future(send(tenant.chat_id,
+                                                       message))))
+    return jobs
+
+
+def settle_batch(tenant, jobs):
+    """Применяет итоги доставки одной пачки, возвращает её успех."""
+    delivered = True
+    for message, homework, future in jobs:
+        if future.result():
+            if homework is not None:
+                tenant.statuses.commit(homework)
+            continue
+        delivered = False
+        if homework is None:
+            tenant.sent.discard(message)
+        else:
+            tenant.statuses.release(homework)
+    return delivered
+
+
+def settle(tenant, store=None):
+    """Применяет результаты завершённых доставок к состоянию подписки.
+
+    Метка времени сдвигается, только если доставлены все сообщения пачки
+    и всех пачек перед ней.
+    """
+    advance = True
+    while tenant.pending and all(
+        future.done() for _, _, future in tenant.pending[0][1]
+    ):
+        current_date, jobs = tenant.pending.pop(0)
+        advance = settle_batch(tenant, jobs) and advance
+        if advance and current_date is not None:
+            tenant.timestamp = current_date
+    if store is not None:
+        store.save(tenant)
+
+
+def poll_feed(tenants, send, deadline=None):
+    """Запрашивает статусы токена один раз и ставит уведомления в чаты.
+
+    Все подписки tenants опрашивают один токен; запрос идёт с самой ранней
+    из их меток времени, повторы отсекает StatusIndex каждой подписки.
+    """
+    leader = tenants[0]
+    try:
+        with stage('get_api_answer'):
+            response = request_statuses(
+                min(tenant.timestamp for tenant in tenants), leader.headers,
+                deadline
+            )
+        with stage('check_response'):
+            homeworks = check_response(response)
+        leader.scheduler.record(homeworks=homeworks)
+        for tenant in tenants:
+            LAST_POLL[tenant.key] = time.time()
+            tenant.pending.append((
+                response.get('current_date', tenant.timestamp),
+                deliver(tenant, send, collect_messages(tenant, homeworks))
+            ))
+    except CircuitOpenError as error:
+        POLLS_SHED.inc(reason='circuit_open')
+        ERRORS.record(error)
+        leader.scheduler.record(error=error)
+    except Exception as error:
+        CYCLE_ERRORS.inc(error=type(error).__name__)
+        ERRORS.record(error)
+        leader.scheduler.record(error=error)
+        notify_error(tenants, send, error)
+
+
+def notify_error(tenants, send, error):
+    """Сообщает об ошибке в чаты подписок вне периода тишины.
+
+    Если задан OPERATOR_CHAT_ID, ошибки уходят только в сводку оператору.
+    """
+    for tenant in tenants:
+        if tenant.errors.record(error) and not OPERATOR_CHAT_ID:
+            tenant.pending.append((None, deliver(
+                tenant, send, [(None, tenant.messages.error(error))]
+            )))
+
+
+def run_feed(tenants, send, store=None, deadline=None):
+    """Один цикл опроса общего токена подписок tenants.
+
+    Запрос к API укладывается в бюджет deadline, если он передан.
+    """
+    context = TENANT.set(tenants[0].key)
+    with contextlib.ExitStack() as stack:
+        for tenant in tenants:
+            stack.enter_context(tenant.lock)
+            settle(tenant)
+        poll_feed(tenants, send, deadline)
+        for tenant in tenants:
+            settle(tenant, store)
+    report_errors(send)
+    TENANT.reset(context)
+
+
+def run_cycle(tenant, send, store=None, deadline=None):
+    """Один цикл опроса подписки с отправкой уведомлений."""
+    run_feed([tenant], send, store, deadline)
+
+
+def ingest(tenant, payload, send, store=None):
+    """Обрабатывает присланные статусы так же, как ответ опроса.
+
+    Метку времени не сдвигает: её продолжает вести опрос-сверка.
+    """
+    homeworks = check_response(payload)
+    context = TENANT.set(tenant.key)
+    with tenant.lock:
+        settle(tenant)
+        if homeworks:
+            tenant.pending.append(
+                (None, deliver(tenant, send,
+                               collect_messages(tenant, homeworks)))
+            )
+        settle(tenant, store)
+    TENANT.reset(context)
+    return len(homeworks)
+
+
+class IngestHandler:
+    """Принимает статусы работ по POST /homeworks.
+
+    Тело — ответ API в формате, который проверяет check_response,
+    заголовок Authorization — OAuth-токен подписки.
+    """
+
+    def do_POST(self):
+        """Обрабатывает присланные статусы."""
+        if self.path != '/homeworks':
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        tenants = self.server.engine.by_token.get(
+            self.headers.get('Authorization')
+        )
+        if not tenants:
+            self.send_error(HTTPStatus.UNAUTHORIZED)
+            return
+        length = self._content_length()
+        if length is None:
+            return
+        try:
+            payload = json_loads(self.rfile.read(length))
+            for tenant in tenants:
+                self.server.engine.ingest(tenant, payload)
+        except (ValueError, TypeError, KeyError) as error:
+            logging.warning(INGEST_REJECTED.format(error))
+            self.send_error(HTTPStatus.BAD_REQUEST, explain=str(error))
+            return
+        self.send_response(HTTPStatus.ACCEPTED)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """Не пишет в лог каждый запрос."""
+
+    def _content_length(self):
+        value = self.headers.get('Content-Length')
+        if value is None:
+            self.send_error(HTTPStatus.LENGTH_REQUIRED)
+            return None
+        try:
+            length = int(value)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(HTTPStatus.BAD_REQUEST)
+            return None
+        if length > INGEST_MAX_BODY:
+            self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return None
+        return length
+
+
+def start_ingest_server(engine, port, host=''):
+    """Запускает приём статусов в фоновом потоке."""
+    server = http_server.ThreadingHTTPServer((host, int(port)),
+                                             http_handler(IngestHandler))
+    server.engine = engine
+    threading.Thread(
+        target=server.serve_forever, name='ingest', daemon=True
+    ).start()
+    logging.info(INGEST_STARTED.format(server.server_address[1]))
+    return server
+
+
+class TimingWheel:
+    """Хэшированное колесо таймеров: вставка и отмена ключа за O(1).
+
+    Срок ключа округляется до тика и сдвигается на случайную долю jitter,
+    чтобы опросы с одинаковым периодом расходились по времени.
+    """
+
+    def __init__(self, tick=WHEEL_TICK, size=WHEEL_SIZE, jitter=WHEEL_JITTER):
+        """Создаёт колесо из size ячеек по tick секунд."""
+        self.tick = tick
+        self.size = size
+        self.jitter = jitter
+        self.slots = [{} for _ in range(size)]
+        self.where = {}
+        self.position = 0
+
+    def __contains__(self, key):
+        """Запланирован ли ключ."""
+        return key in self.where
+
+    def __len__(self):
+        """Число запланированных ключей."""
+        return len(self.where)
+
+    def schedule(self, key, delay):
+        """Планирует ключ через delay секунд, заменяя прежний срок."""
+        self.cancel(key)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        ticks = max(1, round(delay / self.tick))
+        slot = (self.position + ticks) % self.size
+        self.slots[slot][key] = (ticks - 1) // self.size
+        self.where[key] = slot
+
+    def cancel(self, key):
+        """Снимает ключ с колеса."""
+        slot = self.where.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self):
+        """Поворачивает колесо на тик и возвращает наступившие ключи."""
+        self.position = (self.position + 1) % self.size
+        slot = self.slots[self.position]
+        due = []
+        for key, rounds in list(slot.items()):
+            if rounds:
+                slot[key] = rounds - 1
+                continue
+            del slot[key]
+            del self.where[key]
+            due.append(key)
+        return due
+
+
+class PollingEngine:
+    """Асинхронный опрос множества подписок из одного процесса."""
+
+    def __init__(self, bot, tenants, concurrency=ENGINE_CONCURRENCY,
+                 period=RETRY_PERIOD, store=None, ingest_port=None,
+                 budget=POLL_BUDGET, digest_window=DIGEST_WINDOW,
+                 cycle_timeout=CYCLE_TIMEOUT):
+        """Готовит пул потоков для блокирующих запросов."""
+        self.bot = bot
+        self.budget = budget
+        self.cycle_timeout = cycle_timeout
+        self.tenants = tenants
+        self.active = {}
+        self.feeds = {}
+        self.wheel = TimingWheel()
+        self.tasks = {}
+        self.by_token = self.index_tokens(tenants)
+        self.ingest_port = ingest_port
+        self.ingest_server = None
+        self.store = store
+        self.period = period
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.semaphore = None
+        self.stopped = None
+        self.outbox = SendQueue(self.send)
+        self.digest = Digest(self.outbox.put, digest_window)
+
+    def send(self, chat_id, message):
+        """Отправляет сообщение в чат подписки."""
+        return send_to_chat(self.bot, chat_id, message)
+
+    def ingest(self, tenant, payload):
+        """Передаёт присланные статусы в общий путь отправки."""
+        return ingest(tenant, payload, self.digest.put, self.store)
+
+    def assign(self, tenants):
+        """Меняет набор опрашиваемых подписок без перезапуска."""
+        wanted = {tenant.key: tenant for tenant in tenants}
+        self._checkpoint(self._drop(wanted))
+        added = [
+            tenant for key, tenant in wanted.items()
+            if key not in self.active
+        ]
+        if self.store is not None:
+            self.store.restore(added)
+        for tenant in added:
+            self.active[tenant.key] = tenant
+        self._schedule_feeds(self.group_feeds(self.active.values()))
+        self.by_token = self.index_tokens(self.active.values())
+
+    async def release(self, tenants):
+        """Отдаёт подписки, которых нет в tenants, другому шарду.
+
+        Дожидается их текущих опросов и записывает состояние в хранилище,
+        чтобы новый владелец восстановил актуальную метку времени.
+        """
+        released = self._drop({tenant.key for tenant in tenants})
+        feeds = self.group_feeds(self.active.values())
+        in_flight = [
+            self.tasks[feed] for feed in self.feeds
+            if feed not in feeds and feed in self.tasks
+        ]
+        for feed in self.feeds:
+            if feed not in feeds:
+                self.wheel.cancel(feed)
+        self.feeds = feeds
+        self.by_token = self.index_tokens(self.active.values())
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=self.cycle_timeout)
+        self._checkpoint(released)
+        return released
+
+    def _drop(self, wanted):
+        released = [
+            self.active.pop(key) for key in list(self.active)
+            if key not in wanted
+        ]
+        for tenant in released:
+            LAST_POLL.pop(tenant.key, None)
+        return released
+
+    def _checkpoint(self, released):
+        if self.store is None:
+            return
+        for tenant in released:
+            self.store.save(tenant)
+        self.store.flush()
+
+    def _schedule_feeds(self, feeds):
+        for feed in self.feeds:
+            if feed not in feeds:
+                self.wheel.cancel(feed)
+                if feed in self.tasks:
+                    self.tasks.pop(feed).cancel()
+        for feed in feeds:
+            if feed not in self.feeds:
+                self.wheel.schedule(feed, random.uniform(0, self.period))
+        self.feeds = feeds
+
+    @staticmethod
+    def group_feeds(tenants):
+        """Подписки по ключу общего токена."""
+        feeds = {}
+        for tenant in tenants:
+            feeds.setdefault(tenant.feed, []).append(tenant)
+        return feeds
+
+    @staticmethod
+    def index_tokens(tenants):
+        """Подписки по заголовку Authorization."""
+        by_token = {}
+        for tenant in tenants:
+            by_token.setdefault(
+                tenant.headers['Authorization'], []
+            ).append(tenant)
+        return by_token
+
+    def stop(self):
+        """Останавливает опрос."""
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def run(self):
+        """Запускает опрос подписок до вызова stop()."""
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.stopped = asyncio.Event()
+        self.outbox.start()
+        if self.digest.window:
+            self.digest.start()
+        self.assign(self.tenants)
+        logging.info(ENGINE_STARTED.format(len(self.active)))
+        if self.ingest_port:
+            self.ingest_server = start_ingest_server(self, self.ingest_port)
+        driver = asyncio.ensure_future(self.turn_wheel())
+        try:
+            await self.stopped.wait()
+        finally:
+            driver.cancel()
+            for task in list(self.tasks.values()):
+                task.cancel()
+            if self.ingest_server is not None:
+                self.ingest_server.shutdown()
+            self.digest.stop()
+            self.outbox.stop()
+            self.executor.shutdown(wait=False)
+            if self.store is not None:
+                for tenant in self.active.values():
+                    self.store.save(tenant)
+                self.store.close()
+
+    async def turn_wheel(self):
+        """Раз в тик колеса запускает опросы токенов, чей срок наступил."""
+        loop = asyncio.get_running_loop()
+        turned = loop.time()
+        while True:
+            await asyncio.sleep(max(0, turned + self.wheel.tick - loop.time()))
+            while turned + self.wheel.tick <= loop.time():
+                turned += self.wheel.tick
+                for feed in self.wheel.advance():
+                    self.tasks[feed] = asyncio.ensure_future(
+                        self.poll_feed(feed)
+                    )
+
+    async def poll_feed(self, feed):
+        """Опрашивает токен и ставит следующий опрос на колесо."""
+        try:
+            await self.poll_once(self.feeds[feed])
+        finally:
+            self.tasks.pop(feed, None)
+        if feed in self.feeds:
+            self.wheel.schedule(feed,
+                                self.feeds[feed][0].scheduler.next_delay())
+
+    async def poll_once(self, tenants):
+        """Выполняет цикл опроса общего токена подписок в пуле потоков.
+
+        Если свободный поток не нашёлся за бюджет цикла, опрос пропускается.
+        Поток нельзя прервать, поэтому зависший опрос только учитывается:
+        слот и следующий опрос токена ждут, пока поток не закончит.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = Deadline(self.budget)
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(),
+                                   deadline.remaining())
+        except asyncio.TimeoutError:
+            POLLS_SHED.inc(reason='deadline')
+            logging.warning(POLL_SHED.format(tenants[0].key))
+            return
+        try:
+            running = loop.run_in_executor(
+                self.executor, run_feed, tenants, self.digest.put, self.store,
+                deadline
+            )
+            try:
+                await asyncio.wait_for(asyncio.shield(running),
+                                       self.cycle_timeout)
+            except asyncio.TimeoutError:
+                CYCLE_TIMEOUTS.inc()
+                logging.error(CYCLE_HUNG.format(tenants[0].key,
+                                                self.cycle_timeout))
+                await running
+        finally:
+            self.semaphore.release()
+
+
+def create_engine(tenants, ingest_port=None, store=None):
+    """Создаёт бота, сессию и движок опроса для подписок."""
+    if not TELEGRAM_TOKEN:
+        logging.critical(NOT_TOKENS_ERROR.format(['TELEGRAM_TOKEN']))
+        raise ValueError(TOKEN_CHEK)
+    check_cycle_timeout()
+    bot = telegram.Bot(token=TELEGRAM_TOKEN)
+    configure_session(pool_size=max(HTTP_POOL_SIZE, ENGINE_CONCURRENCY))
+    if store is None:
+        store = open_checkpoint_store()
+    return PollingEngine(bot, tenants, store=store, ingest_port=ingest_port)
+
+
+def run_engine():
+    """Запуск опроса всех подписок из SUBSCRIPTIONS_FILE."""
+    tenants = load_subscriptions(SUBSCRIPTIONS_FILE)
+    if INGEST_PORT:
+        for tenant in tenants:
+            tenant.scheduler = FixedScheduler(INGEST_RECONCILE_PERIOD)
+    asyncio.run(create_engine(tenants, ingest_port=INGEST_PORT).run())
+
+
+class HashRing:
+    """Консистентное хэширование ключей подписок по шардам."""
+
+    def __init__(self, nodes, replicas=HASH_RING_REPLICAS):
+        """Размещает на кольце replicas точек для каждого шарда."""
+        self.ring = sorted(
+            (self.hash(f'{node}:{index}'), node)
+            for node in nodes
+            for index in range(replicas)
+        )
+        self.points = [point for point, _ in self.ring]
+
+    @staticmethod
+    def hash(value):
+        """Позиция строки на кольце."""
+        return int.from_bytes(
+            hashlib.md5(value.encode()).digest()[:8], 'big'
+        )
+
+    def node_for(self, key):
+        """Шард, которому принадлежит ключ."""
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+def shard_tenants(tenants, shard, alive):
+    """Подписки шарда shard при живых шардах из списка флагов alive."""
+    ring = HashRing([index for index, flag in enumerate(alive) if flag])
+    return [
+        tenant for tenant in tenants if ring.node_for(tenant.feed) == shard
+    ]
+
+
+async def wait_handoff(alive, generation, acked, current,
+                       timeout=SHARD_HANDOFF_TIMEOUT):
+    """Ждёт, пока все живые шарды отдадут подписки поколения current.
+
+    Возвращает False, если состав шардов за это время снова изменился.
+    """
+    deadline = Deadline(timeout)
+    while not deadline.expired():
+        with generation.get_lock():
+            if generation.value != current:
+                return False
+            if all(
+                acked[index] >= current
+                for index, flag in enumerate(alive[:]) if flag
+            ):
+                return True
+        await asyncio.sleep(SHARD_HANDOFF_POLL)
+    logging.warning(SHARD_HANDOFF_LATE.format(current, timeout))
+    return True
+
+
+async def follow_shards(engine, tenants, shard, alive, generation, acked):
+    """Перераспределяет подписки воркера при смене состава шардов.
+
+    Сначала шард отдаёт чужие подписки и отмечает это в acked, затем
+    ждёт того же от остальных живых шардов и только потом берёт новые.
+    """
+    parent = os.getppid()
+    seen = None
+    while os.getppid() == parent:
+        with generation.get_lock():
+            current, flags = generation.value, alive[:]
+        if current == seen:
+            await asyncio.sleep(SHARD_CHECK_INTERVAL)
+            continue
+        assigned = shard_tenants(tenants, shard, flags)
+        await engine.release(assigned)
+        acked[shard] = current
+        if await wait_handoff(alive, generation, acked, current):
+            seen = current
+            engine.assign(assigned)
+            logging.info(SHARD_STARTED.format(shard, len(assigned)))
+    engine.stop()
+
+
+def run_shard(shard, alive, generation, acked):
+    """Процесс-воркер, опрашивающий подписки своего шарда.
+
+    Состояние пишется в CHECKPOINT_DB после каждого цикла, чтобы при
+    падении воркера его подписки продолжились без повторов.
+    """
+    configure_logging(path=f'{LOG_FILE}.{shard}')
+    configure_capture(CAPTURE_FILE and f'{CAPTURE_FILE}.{shard}')
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT) + shard)
+    tenants = load_subscriptions(SUBSCRIPTIONS_FILE)
+    engine = create_engine([], store=CheckpointStore(CHECKPOINT_DB,
+                                                     batch_size=1))
+
+    async def serve():
+        watcher = asyncio.ensure_future(
+            follow_shards(engine, tenants, shard, alive, generation, acked)
+        )
+        try:
+            await engine.run()
+        finally:
+            watcher.cancel()
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+    """Запускает воркеры шардов и перезапускает упавшие."""
+
+    def __init__(self, workers=WORKERS, restart_delay=SHARD_RESTART_DELAY,
+                 checkpoint_db=CHECKPOINT_DB):
+        """Готовит общие для воркеров флаги живых шардов."""
+        if not checkpoint_db:
+            logging.critical(SHARD_CHECKPOINT_REQUIRED)
+            raise ValueError(SHARD_CHECKPOINT_REQUIRED)
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.alive = self.context.Array('b', [1] * workers)
+        self.generation = self.context.Value('i', 0)
+        self.acked = self.context.Array('i', [-1] * workers)
+        self.processes = {}
+        self.died = {}
+
+    def spawn(self, shard):
+        """Запускает процесс шарда."""
+        process = self.context.Process(
+            target=run_shard,
+            args=(shard, self.alive, self.generation, self.acked),
+            name=f'shard-{shard}'
+        )
+        process.start()
+        self.processes[shard] = process
+
+    def bump(self, shard, flag):
+        """Меняет состав живых шардов и сообщает об этом воркерам."""
+        with self.generation.get_lock():
+            self.alive[shard] = flag
+            self.generation.value += 1
+
+    def check(self, shard):
+        """Отмечает упавший воркер и перезапускает его после паузы."""
+        process = self.processes[shard]
+        if process.is_alive():
+            return
+        if self.alive[shard]:
+            self.bump(shard, 0)
+            self.died[shard] = time.monotonic()
+            logging.error(SHARD_DIED.format(shard, process.exitcode))
+        elif time.monotonic() - self.died[shard] >= self.restart_delay:
+            self.spawn(shard)
+            self.bump(shard, 1)
+            logging.info(SHARD_RESTARTED.format(shard))
+
+    def run(self):
+        """Следит за воркерами до остановки процесса."""
+        for shard in range(self.workers):
+            self.spawn(shard)
+        try:
+            while True:
+                for shard in range(self.workers):
+                    self.check(shard)
+                time.sleep(SHARD_CHECK_INTERVAL)
+        finally:
+            for process in self.processes.values():
+                process.terminate()
+
+
+CYCLES = {}
+
+
+def watchdog(budget, name, function, *args):
+    """Выполняет function(*args) в отдельном потоке не дольше budget секунд.
+
+    Зависший вызов бросается: поток доживает в фоне, а вызывающий
+    получает None и продолжает расписание. Пока брошенный вызов с тем же
+    name не закончился, новый не запускается.
+    """
+    previous = CYCLES.get(name)
+    if previous is not None and not wait([previous], budget).done:
+        logging.error(CYCLE_STILL_RUNNING.format(name))
+        return None
+    future = CYCLES[name] = Future()
+
+    def target():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(function(*args))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=target, name=f'cycle-{name}',
+                     daemon=True).start()
+    if not wait([future], budget).done:
+        CYCLE_TIMEOUTS.inc()
+        logging.error(CYCLE_HUNG.format(name, budget))
+        return None
+    return future.result()
+
+
+def main_cycle(tenant, digest, outbox, store):
+    """Цикл main(): опрос, отправка накопленного и учёт доставки."""
+    with PROFILER.cycle():
+        run_cycle(tenant, digest.put, store, Deadline(POLL_BUDGET))
+        digest.flush()
+        outbox.drain(SEND_TIMEOUT)
+        settle(tenant, store)
 
 
 def main():
     """Основная логика работы бота."""
     check_tokens()
+    check_cycle_timeout()
     bot = telegram.Bot(token=TELEGRAM_TOKEN)
-    timestamp = int(time.time())
-    last_error = None
-    while True:
-        try:
-            response = get_api_answer(timestamp)
-            homeworks = check_response(response)
-            if not homeworks:
-                error_message = HOMEWORK_FOR_PERIOD
-            else:
-                error_message = parse_status(homeworks[0])
-            if last_error != error_message:
-                message_sent = send_message(bot, error_message)
-                if message_sent:
-                    timestamp = response.get('current_date', timestamp)
-                    last_error = error_message
-            else:
-                last_error = None
-        except Exception as error:
-            error_description = BOT_ERROR.format(error)
-            send_message(bot, BOT_ERROR.format(error_description))
-            last_error = error_description
-        finally:
-            time.sleep(RETRY_PERIOD)
+    tenant = Tenant(PRACTICUM_TOKEN, TELEGRAM_CHAT_ID)
+    store = open_checkpoint_store()
+    if store is not None:
+        store.restore([tenant])
+    outbox = SendQueue(
+        lambda chat_id, text: route_message(bot, chat_id, text)
+    ).start()
+    digest = Digest(outbox.put)
+    try:
+        while True:
+            try:
+                watchdog(CYCLE_TIMEOUT, tenant.key, main_cycle,
+                         tenant, digest, outbox, store)
+            finally:
+                delay = tenant.scheduler.next_delay()
+                with stage('sleep'):
+                    time.sleep(delay)
+    finally:
+        outbox.stop()
+
+
+def read_capture(path):
+    """Читает записи файла ответов API через отображение в память."""
+    if not os.path.getsize(path):
+        return
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for line in iter(view.readline, b''):
+                if line.strip():
+                    yield json_loads(line)
+
+
+class DryRunBot:
+    """Бот без сети: пишет сообщения в лог вместо отправки в Telegram."""
+
+    def __init__(self):
+        """Создаёт бота без отправленных сообщений."""
+        self.sent = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        """Учитывает сообщение и пишет его в лог."""
+        self.sent += 1
+        logging.info(DRY_RUN_SEND.format(chat_id, text))
+
+
+class ReplayResponse:
+    """Записанный ответ API в виде ответа requests."""
+
+    status_code = HTTPStatus.OK
+    headers = {}
+
+    def __init__(self, payload):
+        """Оборачивает записанное тело ответа."""
+        self.payload = payload
+
+    def json(self):
+        """Тело ответа."""
+        return self.payload
+
+
+class ReplaySession:
+    """Сессия, отдающая записанные ответы вместо запросов к API.
+
+    Паузы между ответами сокращаются в speed раз, при speed=0 их нет.
+    """
+
+    def __init__(self, records, speed=REPLAY_SPEED):
+        """Готовит выдачу записей records."""
+        self.records = iter(records)
+        self.speed = speed
+        self.record = None
+        self.served = 0
+
+    def advance(self):
+        """Переходит к следующей записи; False, если записи кончились."""
+        previous = self.record
+        self.record = next(self.records, None)
+        if self.record is None:
+            return False
+        if self.speed and previous is not None:
+            time.sleep(max(0, self.record['at'] - previous['at']) / self.speed)
+        self.served += 1
+        return True
+
+    def get(self, **kwargs):
+        """Текущая запись вместо ответа эндпоинта."""
+        return ReplayResponse(self.record['response'])
+
+
+def replay_tenant(tenants, key, chat_id=None):
+    """Подписка для записей с ключом key из файла ответов.
+
+    У каждой записанной подписки свои StatusIndex и отсев повторов, токен
+    не нужен: ответы отдаёт ReplaySession. Без chat_id сообщения идут в
+    чат из ключа записи.
+    """
+    tenant = tenants.get(key)
+    if tenant is None:
+        recorded = key.partition(':')[0] if key else TELEGRAM_CHAT_ID
+        tenant = tenants[key] = Tenant(f'replay:{key}', chat_id or recorded,
+                                       timestamp=0)
+    return tenant
+
+
+def replay(path, bot, speed=REPLAY_SPEED, chat_rate=TELEGRAM_CHAT_RATE,
+           global_rate=TELEGRAM_GLOBAL_RATE, chat_id=None):
+    """Прогоняет записанные ответы через цикл main() и очередь отправки.
+
+    Ответы подменяют запросы к API, поэтому работают StatusIndex, отсев
+    повторов, сводки и SendQueue; заново они не записываются. Записи
+    разных подписок идут в исходном порядке, каждая через своё состояние.
+    Если задан chat_id, все сообщения уходят в этот чат; chat_rate и
+    global_rate, равные 0, снимают ограничения частоты отправки.
+    Возвращает число ответов, доставленных сообщений и ошибок цикла.
+    """
+    global SESSION, CAPTURE
+    previous = SESSION, CAPTURE
+    SESSION, CAPTURE = ReplaySession(read_capture(path), speed), None
+    delivered = itertools.count()
+
+    def send(chat_id, text):
+        if not route_message(bot, chat_id, text):
+            return False
+        next(delivered)
+        return True
+
+    tenants = {}
+    outbox = SendQueue(send, chat_rate=chat_rate,
+                       global_rate=global_rate).start()
+    digest = Digest(outbox.put)
+    failed = sum(CYCLE_ERRORS.values.values())
+    try:
+        while SESSION.advance():
+            main_cycle(replay_tenant(tenants, SESSION.record.get('tenant'),
+                                     chat_id),
+                       digest, outbox, None)
+        responses = SESSION.served
+    finally:
+        outbox.stop()
+        SESSION, CAPTURE = previous
+    result = (responses, next(delivered),
+              sum(CYCLE_ERRORS.values.values()) - failed)
+    logging.info(REPLAY_FINISHED.format(*result))
+    return result
+
+
+def startup_report():
+    """Разбивка времени запуска по импортам."""
+    return STARTUP_REPORT.format(', '.join(
+        f'{name} {seconds * 1000:.1f} мс'
+        for name, seconds in IMPORT_TIMES.items()
+    ))
+
+
+IMPORT_TIMES['homework'] = time.perf_counter() - BOOT_STARTED
 
 
 if __name__ == '__main__':
-    logging.basicConfig(
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        filemode='w',
-        handlers=[
-            logging.FileHandler(__file__ + '.log')
-        ],
-        level=logging.INFO
-    )
-    main()
+    configure_logging()
+    logging.info(startup_report())
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, PROFILER.request)
+    if METRICS_PORT and not (SUBSCRIPTIONS_FILE and WORKERS > 1):
+        start_metrics_server(METRICS_PORT)
+    if REPLAY_FILE:
+        if REPLAY_LIVE:
+            replay(REPLAY_FILE, telegram.Bot(token=TELEGRAM_TOKEN),
+                   chat_id=TELEGRAM_CHAT_ID)
+        else:
+            replay(REPLAY_FILE, DryRunBot(), chat_rate=0, global_rate=0)
+    elif SUBSCRIPTIONS_FILE and WORKERS > 1:
+        Supervisor().run()
+    elif SUBSCRIPTIONS_FILE:
+        configure_capture()
+        run_engine()
+    else:
+        configure_session()
+        configure_capture()
+        main()
@@ -0,0 +1,174 @@
+"""Бенчмарк цикла get_api_answer -> check_response -> parse_status ->
+send_message на моках из tests/utils.py.
+
+Запуск из корня репозитория:
+
+    python tests/benchmark.py
+    python tests/benchmark.py --cycles 5000 --homeworks 50
+    python tests/benchmark.py --save-baseline
+
+Результат сравнивается с tests/benchmark_baseline.json.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from http import HTTPStatus
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+os.environ.setdefault('PRACTICUM_TOKEN', 'sometoken')
+os.environ.setdefault('TELEGRAM_TOKEN', '1234:abcdefg')
+os.environ.setdefault('TELEGRAM_CHAT_ID', '12345')
+
+import requests  # noqa: E402
+
+import homework  # noqa: E402
+import utils  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'benchmark_baseline.json')
+STAGES = ('get_api_answer', 'check_response', 'parse_status', 'send_message')
+STATUSES = ('approved', 'reviewing', 'rejected')
+TIMESTAMP = 1000198000
+
+
+def make_data(homeworks_qty):
+    return {
+        'homeworks': [
+            {
+                'id': index,
+                'homework_name': f'hw{index}',
+                'status': STATUSES[index % len(STATUSES)],
+            }
+            for index in range(homeworks_qty)
+        ],
+        'current_date': TIMESTAMP,
+    }
+
+
+def run_cycle(bot, timestamps):
+    started = time.perf_counter()
+    response = homework.get_api_answer(TIMESTAMP)
+    fetched = time.perf_counter()
+    homeworks = homework.check_response(response)
+    checked = time.perf_counter()
+    messages = [homework.parse_status(item) for item in homeworks]
+    parsed = time.perf_counter()
+    for message in messages:
+        homework.send_message(bot, message)
+    sent = time.perf_counter()
+    for stage, elapsed in zip(
+        STAGES,
+        (fetched - started, checked - fetched, parsed - checked,
+         sent - parsed)
+    ):
+        timestamps[stage].append(elapsed)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def measure(cycles, homeworks_qty):
+    data = make_data(homeworks_qty)
+
+    def mock_get(*args, **kwargs):
+        return utils.MockResponseGET(
+            *args, random_timestamp=TIMESTAMP, http_status=HTTPStatus.OK,
+            data=data, **kwargs
+        )
+
+    requests.get = mock_get
+    bot = utils.MockTelegramBot()
+    timestamps = {stage: [] for stage in STAGES}
+    started = time.perf_counter()
+    for _ in range(cycles):
+        run_cycle(bot, timestamps)
+    elapsed = time.perf_counter() - started
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(cycles, 200)):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        run_cycle(bot, {stage: [] for stage in STAGES})
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+
+    result = {
+        'cycles': cycles,
+        'homeworks': homeworks_qty,
+        'cycles_per_second': cycles / elapsed,
+        'bytes_per_cycle': statistics.mean(peaks),
+        'stages': {},
+    }
+    for stage, values in timestamps.items():
+        result['stages'][stage] = {
+            'p50_us': percentile(values, 0.5) * 1e6,
+            'p99_us': percentile(values, 0.99) * 1e6,
+        }
+    return result
+
+
+def change(current, baseline):
+    if not baseline:
+        return ''
+    return f' ({(current - baseline) / baseline:+.1%})'
+
+
+def report(result, baseline):
+    baseline = baseline or {}
+    print(f'Циклов: {result["cycles"]}, работ в ответе: '
+          f'{result["homeworks"]}')
+    print('Пропускная способность: {:.0f} циклов/с{}'.format(
+        result['cycles_per_second'],
+        change(result['cycles_per_second'],
+               baseline.get('cycles_per_second'))
+    ))
+    print('Память на цикл (пик): {:.0f} байт{}'.format(
+        result['bytes_per_cycle'],
+        change(result['bytes_per_cycle'], baseline.get('bytes_per_cycle'))
+    ))
+    for stage in STAGES:
+        current = result['stages'][stage]
+        previous = baseline.get('stages', {}).get(stage, {})
+        print('{:<16} p50 {:>9.1f} мкс{:<10} p99 {:>9.1f} мкс{}'.format(
+            stage,
+            current['p50_us'], change(current['p50_us'],
+                                      previous.get('p50_us')),
+            current['p99_us'], change(current['p99_us'],
+                                      previous.get('p99_us')),
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--homeworks', type=int, default=10)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    result = measure(args.cycles, args.homeworks)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+    report(result, baseline)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+            file.write('\n')
+
+
+if __name__ == '__main__':
+    main()
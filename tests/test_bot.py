@@ -1,8 +1,18 @@
+import asyncio
+import atexit
 import inspect
+import json
 import logging
+import logging.handlers
 import platform
 import re
+import socket
+import subprocess
+import sys
+import threading
 import time
+import urllib.error
+import urllib.request
 from http import HTTPStatus
 
 import pytest
@@ -777,5 +787,1573 @@ class TestHomework:
             utils.check_docstring(homework_module, func)
 
 
+class TestPollingEngine:
+
+    def test_load_subscriptions(self, tmp_path, homework_module):
+        path = tmp_path / 'subscriptions.jsonl'
+        path.write_text(
+            '{"token": "first", "chat_id": 1}\n'
+            '\n'
+            '{"token": "second", "chat_id": "2"}\n',
+            encoding='utf-8'
+        )
+        tenants = homework_module.load_subscriptions(str(path))
+        assert [tenant.chat_id for tenant in tenants] == ['1', '2'], (
+            'Проверьте, что подписки загружаются из файла JSON Lines.'
+        )
+        assert tenants[0].headers == {'Authorization': 'OAuth first'}, (
+            'Проверьте, что для каждой подписки формируется свой заголовок.'
+        )
+
+    def test_engine_polls_every_tenant(self, monkeypatch, random_timestamp,
+                                       data_with_new_hw_status,
+                                       homework_module):
+        requested_tokens = []
+
+        def mock_response_get(*args, **kwargs):
+            requested_tokens.append(kwargs['headers']['Authorization'])
+            return utils.MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                data=data_with_new_hw_status, **kwargs
+            )
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+        sent = []
+
+        class RecordingBot(utils.MockTelegramBot):
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                sent.append((chat_id, text))
+
+        tenants = [
+            homework_module.Tenant(f'token{index}', str(index))
+            for index in range(3)
+        ]
+        engine = homework_module.PollingEngine(RecordingBot(), tenants,
+                                               concurrency=2)
+
+        async def poll_all():
+            engine.semaphore = asyncio.Semaphore(engine.concurrency)
+            await asyncio.gather(
+                *(engine.poll_once([tenant]) for tenant in tenants)
+            )
+
+        engine.outbox.start()
+        try:
+            asyncio.run(poll_all())
+            engine.outbox.drain(timeout=1)
+        finally:
+            engine.outbox.stop()
+        for tenant in tenants:
+            homework_module.settle(tenant)
+        assert sorted(requested_tokens) == [
+            'OAuth token0', 'OAuth token1', 'OAuth token2'
+        ], 'Убедитесь, что каждая подписка опрашивается со своим токеном.'
+        assert sorted(chat_id for chat_id, _ in sent) == ['0', '1', '2'], (
+            'Убедитесь, что уведомления уходят в чаты своих подписок.'
+        )
+        assert all(
+            tenant.timestamp == random_timestamp for tenant in tenants
+        ), 'Убедитесь, что метка времени подписки сдвигается после отправки.'
+
+
+class TestSession:
+
+    def test_create_session(self, homework_module):
+        session = homework_module.create_session(pool_size=7, retries=2)
+        adapter = session.get_adapter(homework_module.ENDPOINT)
+        assert adapter._pool_maxsize == 7, (
+            'Проверьте, что размер пула соединений настраивается.'
+        )
+        assert adapter.max_retries.connect == 2, (
+            'Проверьте, что число повторов при обрыве соединения '
+            'настраивается.'
+        )
+        assert (
+            session.headers['Authorization']
+            == homework_module.HEADERS['Authorization']
+        ), 'Проверьте, что заголовки HEADERS установлены в сессии.'
+
+    def test_get_api_answer_uses_session(self, monkeypatch, random_timestamp,
+                                         current_timestamp, homework_module):
+        calls = []
+
+        class MockSession:
+            def get(self, *args, **kwargs):
+                calls.append(kwargs)
+                return utils.MockResponseGET(
+                    random_timestamp=random_timestamp
+                )
+
+        monkeypatch.setattr(homework_module, 'SESSION', MockSession())
+        result = homework_module.get_api_answer(current_timestamp)
+        assert calls, (
+            'Убедитесь, что при настроенной сессии запрос идёт через неё.'
+        )
+        assert result['current_date'] == random_timestamp
+
+
+class TestAdaptiveScheduler:
+
+    def test_reviewing_shortens_period(self, homework_module):
+        scheduler = homework_module.AdaptiveScheduler(
+            period=600, reviewing_period=120
+        )
+        scheduler.record(homeworks=[
+            homework_module.Homework(1, 'hw1', 'reviewing')
+        ])
+        assert scheduler.next_delay() == 120
+        scheduler.record(homeworks=[])
+        assert scheduler.next_delay() == 120, (
+            'Пока работа на проверке, период опроса должен быть коротким.'
+        )
+        scheduler.record(homeworks=[
+            homework_module.Homework(1, 'hw1', 'approved')
+        ])
+        assert scheduler.next_delay() == 600
+
+    def test_idle_lengthens_period(self, homework_module):
+        scheduler = homework_module.AdaptiveScheduler(
+            period=600, idle_period=3600, idle_after=3
+        )
+        for _ in range(2):
+            scheduler.record(homeworks=[])
+        assert scheduler.next_delay() == 600
+        scheduler.record(homeworks=[])
+        assert scheduler.next_delay() == 3600, (
+            'Для простаивающего аккаунта период опроса должен расти.'
+        )
+
+    def test_backoff_after_errors(self, homework_module):
+        scheduler = homework_module.AdaptiveScheduler(
+            period=600, max_backoff=2000
+        )
+        scheduler.record(error=ConnectionError())
+        assert 300 <= scheduler.next_delay() <= 600
+        scheduler.record(error=ValueError())
+        assert 600 <= scheduler.next_delay() <= 1200
+        for _ in range(5):
+            scheduler.record(error=ConnectionError())
+        assert scheduler.next_delay() <= 2000, (
+            'Откат после ошибок должен ограничиваться max_backoff.'
+        )
+        scheduler.record(homeworks=[])
+        assert scheduler.next_delay() == 600
+
+
+class TestCheckpointStore:
+
+    def test_checkpoint_survives_restart(self, tmp_path, homework_module):
+        path = str(tmp_path / 'state.db')
+        store = homework_module.CheckpointStore(path, batch_size=10)
+        tenant = homework_module.Tenant('token', '1', timestamp=100)
+        tenant.sent.add('Последнее сообщение')
+        store.save(tenant)
+        store.close()
+
+        store = homework_module.CheckpointStore(path)
+        restored = homework_module.Tenant('token', '1', timestamp=999)
+        other = homework_module.Tenant('other', '1', timestamp=999)
+        store.restore([restored, other])
+        store.close()
+        assert restored.timestamp == 100, (
+            'Проверьте, что метка времени восстанавливается после рестарта.'
+        )
+        assert 'Последнее сообщение' in restored.sent, (
+            'Проверьте, что отправленные сообщения восстанавливаются после '
+            'рестарта.'
+        )
+        assert other.timestamp == 999, (
+            'Проверьте, что состояние хранится отдельно для каждой подписки.'
+        )
+
+    def test_save_is_batched(self, tmp_path, homework_module):
+        store = homework_module.CheckpointStore(
+            str(tmp_path / 'state.db'), batch_size=3, interval=3600
+        )
+        for index in range(2):
+            store.save(homework_module.Tenant(f'token{index}', str(index)))
+        assert store.load_all() == {}, (
+            'Проверьте, что записи накапливаются до размера пакета.'
+        )
+        store.save(homework_module.Tenant('token2', '2'))
+        assert len(store.load_all()) == 3
+        store.close()
+
+
+class TestStatusIndex:
+
+    def test_every_transition_is_sent_once(self, monkeypatch, random_timestamp,
+                                           homework_module):
+        data = {
+            'homeworks': [
+                {'id': 1, 'homework_name': 'hw1', 'status': 'reviewing'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'approved'},
+            ],
+            'current_date': random_timestamp
+        }
+        monkeypatch.setattr(
+            requests, 'get',
+            create_mock_response_get_with_custom_status_and_data(
+                random_timestamp, HTTPStatus.OK, data
+            )
+        )
+        sent = []
+
+        def send(chat_id, message):
+            sent.append(message)
+            return True
+
+        tenant = homework_module.Tenant('token', '1')
+        homework_module.run_cycle(tenant, send)
+        assert len(sent) == 2, (
+            'Убедитесь, что бот сообщает об изменении каждой работы в ответе.'
+        )
+        homework_module.run_cycle(tenant, send)
+        assert len(sent) == 2, (
+            'Убедитесь, что без смены статуса сообщение не отправляется.'
+        )
+        data['homeworks'][0]['status'] = 'rejected'
+        homework_module.run_cycle(tenant, send)
+        assert len(sent) == 3 and 'hw1' in sent[-1]
+
+    def test_failed_delivery_is_retried(self, homework_module):
+        tenant = homework_module.Tenant('token', '1')
+        homeworks = homework_module.check_response({
+            'homeworks': [{'homework_name': 'hw1', 'status': 'approved'}]
+        })
+        messages = homework_module.collect_messages(tenant, homeworks)
+        timestamp = tenant.timestamp
+        tenant.pending.append((
+            timestamp + 1,
+            homework_module.deliver(tenant, lambda *args: False, messages)
+        ))
+        homework_module.settle(tenant)
+        assert tenant.timestamp == timestamp, (
+            'Метка времени не должна сдвигаться при неудачной доставке.'
+        )
+        assert tenant.statuses.changes(homeworks) == homeworks, (
+            'Статус не должен запоминаться, пока сообщение не доставлено.'
+        )
+
+
+class TestSendQueue:
+
+    def test_token_bucket(self, homework_module):
+        bucket = homework_module.TokenBucket(rate=2, capacity=2)
+        now = bucket.updated
+        for _ in range(2):
+            assert bucket.delay(now) == 0
+            bucket.consume()
+        assert bucket.delay(now) == pytest.approx(0.5), (
+            'Проверьте, что пустой бакет сообщает время ожидания токена.'
+        )
+        assert bucket.delay(now + 0.5) == 0
+
+    def test_chat_rate_limit(self, homework_module):
+        sent = []
+        outbox = homework_module.SendQueue(
+            lambda chat_id, text: sent.append((chat_id, time.monotonic()))
+            or True,
+            chat_rate=20, global_rate=1000
+        ).start()
+        try:
+            for chat_id in ('1', '1', '1', '2'):
+                assert outbox.put(chat_id, 'text')
+            assert outbox.drain(timeout=1)
+        finally:
+            outbox.stop()
+        first_chat = [moment for chat_id, moment in sent if chat_id == '1']
+        assert len(sent) == 4
+        assert first_chat[2] - first_chat[0] >= 0.09, (
+            'Убедитесь, что частота отправки в один чат ограничена.'
+        )
+
+    def test_failed_send_is_retried(self, homework_module):
+        attempts = []
+
+        def flaky_send(chat_id, text):
+            attempts.append(text)
+            if len(attempts) == 1:
+                raise telegram.error.TelegramError('Something wrong')
+            return True
+
+        outbox = homework_module.SendQueue(
+            flaky_send, chat_rate=100, retry_delay=0.01, max_attempts=3
+        ).start()
+        try:
+            outbox.put('1', 'text')
+            deadline = time.monotonic() + 1
+            while len(attempts) < 2 and time.monotonic() < deadline:
+                old_sleep(0.01)
+        finally:
+            outbox.stop()
+        assert attempts == ['text', 'text'], (
+            'Убедитесь, что неотправленное сообщение возвращается в очередь.'
+        )
+
+
+class TestDeliveryPool:
+
+    def test_slow_send_does_not_block_polling(self, homework_module):
+        release = threading.Event()
+
+        def slow_send(chat_id, text):
+            release.wait(1)
+            return True
+
+        outbox = homework_module.SendQueue(
+            slow_send, chat_rate=100, workers=2
+        ).start()
+        try:
+            started = time.monotonic()
+            first = outbox.put('1', 'first')
+            second = outbox.put('2', 'second')
+            assert time.monotonic() - started < 0.1, (
+                'Убедитесь, что постановка в очередь не ждёт отправки.'
+            )
+            release.set()
+            assert first.result(timeout=1) and second.result(timeout=1)
+        finally:
+            outbox.stop()
+
+    def test_bounded_queue(self, homework_module):
+        outbox = homework_module.SendQueue(lambda *args: True, maxsize=1)
+        outbox.put('1', 'first', timeout=0)
+        rejected = outbox.put('1', 'second', timeout=0)
+        assert rejected.done() and rejected.result() is False, (
+            'Убедитесь, что переполненная очередь не принимает сообщения.'
+        )
+
+    def test_pending_delivery_advances_timestamp(self, homework_module):
+        tenant = homework_module.Tenant('token', '1', timestamp=1)
+        homeworks = homework_module.check_response({
+            'homeworks': [{'homework_name': 'hw1', 'status': 'approved'}]
+        })
+        future = homework_module.Future()
+        tenant.pending.append((
+            2,
+            homework_module.deliver(
+                tenant, lambda *args: future,
+                homework_module.collect_messages(tenant, homeworks)
+            )
+        ))
+        homework_module.settle(tenant)
+        assert tenant.timestamp == 1
+        assert tenant.statuses.changes(homeworks) == [], (
+            'Убедитесь, что работа в процессе доставки не отправляется '
+            'повторно.'
+        )
+        future.set_result(True)
+        homework_module.settle(tenant)
+        assert tenant.timestamp == 2, (
+            'Убедитесь, что метка времени сдвигается после доставки.'
+        )
+
+
+class TestDecodeJson:
+
+    def test_bytes_body_skips_response_json(self, random_timestamp,
+                                            homework_module):
+        response = utils.MockResponseGET(random_timestamp=random_timestamp)
+        response.content = b'{"homeworks": [], "current_date": 1}'
+        response.json = None
+        assert homework_module.decode_json(response) == {
+            'homeworks': [], 'current_date': 1
+        }
+
+
+class TestMetrics:
+
+    def test_registry_renders_prometheus_text(self, homework_module):
+        registry = homework_module.MetricsRegistry()
+        errors = registry.register(homework_module.Counter(
+            'errors_total', 'Ошибки.'
+        ))
+        latency = registry.register(homework_module.Histogram(
+            'latency_seconds', 'Задержка.', buckets=(0.1, 1)
+        ))
+        errors.inc(error='ValueError')
+        errors.inc(error='ValueError')
+        latency.observe(0.5)
+        latency.observe(0.1)
+        latency.observe(5)
+        text = registry.render()
+        assert '# TYPE errors_total counter' in text
+        assert 'errors_total{error="ValueError"} 2' in text
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text, (
+            'Значение на границе корзины попадает в эту корзину.'
+        )
+        assert 'latency_seconds_bucket{le="1"} 2' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+        assert 'latency_seconds_count 3' in text
+
+    def test_metrics_endpoint(self, monkeypatch, homework_module):
+        monkeypatch.setitem(homework_module.LAST_POLL, 'tenant', time.time())
+        server = homework_module.start_metrics_server(0, host='127.0.0.1')
+        try:
+            url = 'http://127.0.0.1:{}/metrics'.format(server.server_port)
+            body = urllib.request.urlopen(url, timeout=1).read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert 'homework_api_request_seconds' in body
+        assert 'homework_last_poll_age_seconds{tenant="tenant"}' in body, (
+            'Убедитесь, что экспортируется возраст последнего опроса '
+            'подписки.'
+        )
+
+    def test_cycle_error_is_counted(self, monkeypatch, homework_module):
+        def mock_request_get_with_exception(*args, **kwargs):
+            raise requests.RequestException('Something wrong')
+
+        monkeypatch.setattr(requests, 'get', mock_request_get_with_exception)
+        counter = homework_module.CYCLE_ERRORS
+        key = counter.labels_key({'error': 'ConnectionError'})
+        before = counter.values.get(key, 0)
+        homework_module.run_cycle(homework_module.Tenant('token', '1'),
+                                  lambda *args: True)
+        assert counter.values[key] == before + 1
+
+
+class TestValidation:
+
+    def test_check_response_returns_records(self, homework_module):
+        homeworks = homework_module.check_response({
+            'homeworks': [
+                {'id': 7, 'homework_name': 'hw7', 'status': 'approved',
+                 'reviewer_comment': 'Всё нравится'},
+            ],
+            'current_date': 1
+        })
+        assert homeworks == [homework_module.Homework(7, 'hw7', 'approved')]
+        assert homework_module.parse_status(homeworks[0]).endswith(
+            self.HOMEWORK_VERDICTS['approved']
+        )
+
+    HOMEWORK_VERDICTS = TestHomework.HOMEWORK_VERDICTS
+
+    @pytest.mark.parametrize('homework, error', [
+        ({'homework_name': 'hw1'}, KeyError),
+        ({'status': 'approved'}, KeyError),
+        ({'homework_name': 'hw1', 'status': 'unknown'}, ValueError),
+        ('hw1', TypeError),
+    ])
+    def test_invalid_homework_is_skipped(self, homework, error,
+                                         homework_module):
+        with pytest.raises(error):
+            homework_module.validate_homework(homework)
+        skipped = homework_module.HOMEWORKS_SKIPPED
+        before = skipped.values.get((), 0)
+        valid = {'id': 1, 'homework_name': 'hw2', 'status': 'approved'}
+        assert homework_module.check_response(
+            {'homeworks': [homework, valid]}
+        ) == [homework_module.Homework(1, 'hw2', 'approved')], (
+            'Убедитесь, что неверная работа пропускается, а остальные '
+            'работы ответа проверяются.'
+        )
+        assert skipped.values[()] == before + 1
+
+    def test_invalid_homework_does_not_block_watermark(
+            self, monkeypatch, random_timestamp, homework_module):
+        data = {
+            'homeworks': [
+                {'id': 1, 'homework_name': 'hw1', 'status': 'unknown'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'approved'},
+            ],
+            'current_date': random_timestamp
+        }
+        monkeypatch.setattr(
+            requests, 'get',
+            create_mock_response_get_with_custom_status_and_data(
+                random_timestamp, HTTPStatus.OK, data
+            )
+        )
+        sent = []
+
+        def send(chat_id, message):
+            sent.append(message)
+            return True
+
+        tenant = homework_module.Tenant('token', '1', timestamp=0)
+        homework_module.run_cycle(tenant, send)
+        homework_module.run_cycle(tenant, send)
+        assert len(sent) == 1 and 'hw2' in sent[0], (
+            'Убедитесь, что верные работы доставляются, даже если в ответе '
+            'есть работа с неизвестным статусом.'
+        )
+        assert tenant.timestamp == random_timestamp, (
+            'Убедитесь, что неверная работа не останавливает метку времени.'
+        )
+
+
+class TestLogging:
+
+    def test_json_lines_with_tenant(self, tmp_path, homework_module):
+        path = tmp_path / 'bot.log'
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        listener = homework_module.configure_logging(path=str(path),
+                                                     max_bytes=1024)
+        try:
+            context = homework_module.TENANT.set('12345:abc')
+            logging.info('Сообщение подписки')
+            try:
+                raise ValueError('сбой')
+            except ValueError:
+                logging.exception('Ошибка %s', 'подписки')
+            homework_module.TENANT.reset(context)
+            listener.stop()
+            atexit.unregister(listener.stop)
+        finally:
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            for handler in handlers:
+                root.addHandler(handler)
+            root.setLevel(level)
+            for handler in listener.handlers:
+                handler.close()
+        entry, error = (
+            json.loads(line)
+            for line in path.read_text(encoding='utf-8').splitlines()[-2:]
+        )
+        assert entry['message'] == 'Сообщение подписки'
+        assert entry['tenant'] == '12345:abc', (
+            'Убедитесь, что в записи лога есть подписка.'
+        )
+        assert entry['level'] == 'INFO'
+        assert error['message'] == 'Ошибка подписки'
+        assert 'ValueError: сбой' in error['exception'], (
+            'Убедитесь, что трассировка попадает в поле exception, а '
+            'форматируется в потоке записи лога.'
+        )
+
+    def test_rotation_handlers(self, tmp_path, homework_module):
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        try:
+            for rotation, handler_class in (
+                ('size', logging.handlers.RotatingFileHandler),
+                ('midnight', logging.handlers.TimedRotatingFileHandler),
+            ):
+                listener = homework_module.configure_logging(
+                    path=str(tmp_path / f'{rotation}.log'), rotation=rotation
+                )
+                listener.stop()
+                atexit.unregister(listener.stop)
+                assert isinstance(listener.handlers[0], handler_class)
+                listener.handlers[0].close()
+        finally:
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            for handler in handlers:
+                root.addHandler(handler)
+            root.setLevel(level)
+
+
+class TestIngest:
+
+    @staticmethod
+    def post(server, payload, token):
+        request = urllib.request.Request(
+            'http://127.0.0.1:{}/homeworks'.format(server.server_port),
+            data=json.dumps(payload).encode(),
+            headers={'Authorization': f'OAuth {token}'},
+            method='POST'
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=1).status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def test_pushed_statuses_are_delivered(self, homework_module):
+        sent = []
+
+        class RecordingBot(utils.MockTelegramBot):
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                sent.append((chat_id, text))
+
+        tenant = homework_module.Tenant('token', '1', timestamp=5)
+        engine = homework_module.PollingEngine(RecordingBot(), [tenant])
+        engine.outbox.start()
+        server = homework_module.start_ingest_server(engine, 0, '127.0.0.1')
+        payload = {
+            'homeworks': [{'homework_name': 'hw1', 'status': 'approved'}],
+            'current_date': 100
+        }
+        try:
+            assert self.post(server, payload, 'token') == HTTPStatus.ACCEPTED
+            engine.outbox.drain(timeout=1)
+            homework_module.settle(tenant)
+            assert self.post(server, payload, 'token') == HTTPStatus.ACCEPTED
+            engine.outbox.drain(timeout=1)
+            assert self.post(server, payload, 'unknown') == (
+                HTTPStatus.UNAUTHORIZED
+            )
+            assert self.post(server, {'homeworks': {}}, 'token') == (
+                HTTPStatus.BAD_REQUEST
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+            engine.outbox.stop()
+        assert len(sent) == 1 and sent[0][0] == '1', (
+            'Убедитесь, что присланный статус отправляется один раз.'
+        )
+        assert tenant.timestamp == 5, (
+            'Метку времени должен сдвигать только опрос-сверка.'
+        )
+
+    @staticmethod
+    def raw_post(server, length_header):
+        with socket.create_connection(('127.0.0.1', server.server_port),
+                                      timeout=1) as connection:
+            connection.sendall(
+                'POST /homeworks HTTP/1.1\r\nHost: bot\r\n'
+                'Authorization: OAuth token\r\n{}\r\n'.format(
+                    length_header
+                ).encode()
+            )
+            return int(connection.recv(1024).split()[1])
+
+    def test_invalid_content_length(self, homework_module):
+        engine = homework_module.PollingEngine(
+            utils.MockTelegramBot(), [homework_module.Tenant('token', '1')]
+        )
+        server = homework_module.start_ingest_server(engine, 0, '127.0.0.1')
+        try:
+            assert self.raw_post(server, 'Content-Length: abc\r\n') == (
+                HTTPStatus.BAD_REQUEST
+            )
+            assert self.raw_post(server, 'Content-Length: -1\r\n') == (
+                HTTPStatus.BAD_REQUEST
+            ), 'Отрицательная длина тела не должна блокировать обработчик.'
+            assert self.raw_post(server, '') == HTTPStatus.LENGTH_REQUIRED
+            assert self.raw_post(
+                server,
+                f'Content-Length: {homework_module.INGEST_MAX_BODY + 1}\r\n'
+            ) == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestSharding:
+
+    def test_hash_ring_moves_only_dead_shard_keys(self, homework_module):
+        keys = [f'{index}:key' for index in range(1000)]
+        full = homework_module.HashRing(range(4))
+        reduced = homework_module.HashRing([0, 1, 3])
+        owners = {key: full.node_for(key) for key in keys}
+        assert set(owners.values()) == {0, 1, 2, 3}
+        for key in keys:
+            if owners[key] != 2:
+                assert reduced.node_for(key) == owners[key], (
+                    'При падении шарда должны переезжать только его ключи.'
+                )
+
+    def test_shard_tenants_cover_all(self, homework_module):
+        tenants = [
+            homework_module.Tenant(f'token{index}', str(index))
+            for index in range(50)
+        ]
+        alive = [1, 0, 1]
+        shards = [
+            homework_module.shard_tenants(tenants, shard, alive)
+            for shard in range(3)
+        ]
+        assert shards[1] == [], 'Мёртвому шарду не достаются подписки.'
+        assert sorted(
+            tenant.key for shard in shards for tenant in shard
+        ) == sorted(tenant.key for tenant in tenants), (
+            'Каждая подписка должна достаться ровно одному шарду.'
+        )
+
+    def test_engine_reassigns_tenants(self, tmp_path, homework_module):
+        store = homework_module.CheckpointStore(str(tmp_path / 'state.db'))
+        first = homework_module.Tenant('first', '1', timestamp=10)
+        second = homework_module.Tenant('second', '2', timestamp=20)
+        engine = homework_module.PollingEngine(
+            utils.MockTelegramBot(), [], store=store
+        )
+
+        engine.assign([first, second])
+        assert first.feed in engine.wheel and second.feed in engine.wheel
+        engine.assign([second])
+        assert first.feed not in engine.wheel, (
+            'Убедитесь, что опрос ушедшей подписки останавливается.'
+        )
+        store.flush()
+        assert store.load_all()[first.key][0] == 10, (
+            'Состояние ушедшей подписки должно сохраняться для нового шарда.'
+        )
+        store.close()
+
+    def test_release_drops_last_poll(self, tmp_path, homework_module):
+        store = homework_module.CheckpointStore(str(tmp_path / 'state.db'))
+        first = homework_module.Tenant('first', '1', timestamp=10)
+        engine = homework_module.PollingEngine(
+            utils.MockTelegramBot(), [], store=store
+        )
+        engine.assign([first])
+        homework_module.LAST_POLL[first.key] = time.time()
+        assert asyncio.run(engine.release([])) == [first]
+        assert first.key not in homework_module.LAST_POLL, (
+            'Отданная подписка не должна выглядеть зависшей в метриках.'
+        )
+        assert first.feed not in engine.wheel
+        assert store.load_all()[first.key][0] == 10, (
+            'Отданная подписка должна сразу попасть в хранилище.'
+        )
+        store.close()
+
+    def test_handoff_waits_for_live_shards(self, monkeypatch,
+                                           homework_module):
+        import multiprocessing
+        monkeypatch.setattr(homework_module, 'SHARD_HANDOFF_POLL', 0.01)
+        alive = multiprocessing.Array('b', [1, 1, 0])
+        generation = multiprocessing.Value('i', 3)
+        acked = multiprocessing.Array('i', [3, 2, -1])
+
+        async def handoff():
+            waiter = asyncio.ensure_future(homework_module.wait_handoff(
+                alive, generation, acked, 3, timeout=1
+            ))
+            await asyncio.sleep(0.05)
+            assert not waiter.done(), (
+                'Шард не должен забирать подписки, пока другой шард '
+                'не отдал их.'
+            )
+            acked[1] = 3
+            return await waiter
+
+        assert asyncio.run(handoff())
+        generation.value = 4
+        assert not asyncio.run(homework_module.wait_handoff(
+            alive, generation, acked, 3, timeout=1
+        )), 'При новой смене состава передачу нужно начать заново.'
+
+    def test_supervisor_requires_checkpoint_db(self, homework_module):
+        with pytest.raises(ValueError):
+            homework_module.Supervisor(workers=2, checkpoint_db=None)
+
+
+class TestCircuitBreaker:
+
+    def test_breaker_transitions(self, monkeypatch, homework_module):
+        now = [100.0]
+        monkeypatch.setattr(homework_module.time, 'monotonic',
+                            lambda: now[0])
+        breaker = homework_module.CircuitBreaker(failures=2,
+                                                 reset_timeout=10)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert not breaker.allow(), (
+            'Убедитесь, что предохранитель размыкается после серии ошибок.'
+        )
+        now[0] += 10
+        assert breaker.allow(), (
+            'Убедитесь, что после паузы пропускается пробный запрос.'
+        )
+        assert not breaker.allow(), (
+            'Убедитесь, что в полуоткрытом состоянии пропускается только '
+            'один пробный запрос.'
+        )
+        breaker.record_failure()
+        assert not breaker.allow()
+        now[0] += 10
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == breaker.CLOSED
+        assert breaker.allow()
+
+    def test_open_breaker_sheds_poll(self, monkeypatch, homework_module):
+        def mock_get(*args, **kwargs):
+            raise AssertionError('Запрос при разомкнутом предохранителе.')
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        breaker = homework_module.CircuitBreaker(failures=1)
+        breaker.record_failure()
+        monkeypatch.setattr(homework_module, 'BREAKERS',
+                            {homework_module.ENDPOINT: breaker})
+        sent = []
+        shed = homework_module.POLLS_SHED
+        key = shed.labels_key({'reason': 'circuit_open'})
+        before = shed.values.get(key, 0)
+        homework_module.run_cycle(homework_module.Tenant('token', '1'),
+                                  lambda *args: sent.append(args))
+        assert shed.values[key] == before + 1
+        assert not sent, (
+            'Убедитесь, что при разомкнутом предохранителе ошибка не '
+            'отправляется в чат на каждом цикле.'
+        )
+
+    def test_deadline(self, homework_module):
+        assert not homework_module.Deadline(10).expired()
+        assert homework_module.Deadline(0).expired()
+
+    def test_spent_budget_keeps_probe(self, monkeypatch, homework_module):
+        def mock_get(*args, **kwargs):
+            raise RuntimeError('сбой клиента')
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        breaker = homework_module.CircuitBreaker(failures=1, reset_timeout=0)
+        breaker.record_failure()
+        monkeypatch.setattr(homework_module, 'BREAKERS',
+                            {homework_module.ENDPOINT: breaker})
+        headers = {'Authorization': 'OAuth token'}
+        with pytest.raises(TimeoutError):
+            homework_module.request_statuses(0, headers,
+                                             homework_module.Deadline(0))
+        with pytest.raises(RuntimeError):
+            homework_module.request_statuses(0, headers)
+        assert breaker.allow(), (
+            'Пробный запрос, не дошедший до API, не должен оставлять '
+            'предохранитель разомкнутым навсегда.'
+        )
+
+    def test_deadline_caps_request(self, monkeypatch, homework_module):
+        timeouts = []
+
+        def mock_get(*args, **kwargs):
+            timeouts.append(kwargs['timeout'])
+            return utils.MockResponseGET(*args, random_timestamp=0,
+                                         **kwargs)
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        homework_module.run_cycle(homework_module.Tenant('token', '1'),
+                                  lambda *args: True,
+                                  deadline=homework_module.Deadline(10))
+        connect, read = timeouts[0]
+        assert connect <= homework_module.HTTP_CONNECT_TIMEOUT
+        assert read <= 10, (
+            'Убедитесь, что таймаут запроса не превышает остаток бюджета '
+            'цикла.'
+        )
+        timeout, retries = homework_module.request_timeout(
+            homework_module.Deadline(100)
+        )
+        assert retries == int(100 // sum(timeout)) - 1
+        with pytest.raises(TimeoutError):
+            homework_module.request_timeout(homework_module.Deadline(0))
+
+    def test_default_budget_keeps_a_retry(self, homework_module):
+        import urllib3
+        deadline = homework_module.Deadline(homework_module.POLL_BUDGET)
+        timeout, retries = homework_module.request_timeout(deadline)
+        assert retries >= 1, (
+            'С настройками по умолчанию после первой попытки должен '
+            'оставаться хотя бы один повтор.'
+        )
+        assert sum(timeout) * (retries + 1) <= homework_module.POLL_BUDGET
+        homework_module.REQUEST_BUDGET.retries = retries
+        try:
+            retry = homework_module.create_retry(homework_module.HTTP_RETRIES)
+            retry = retry.increment(
+                method='GET', url='/',
+                error=urllib3.exceptions.ProtocolError(
+                    'Connection aborted.', ConnectionResetError()
+                ),
+            )
+            assert len(retry.history) == 1
+        finally:
+            homework_module.REQUEST_BUDGET.retries = None
+        assert homework_module.CYCLE_TIMEOUT >= (
+            homework_module.POLL_BUDGET + homework_module.SEND_TIMEOUT
+        )
+
+    def test_retries_stop_with_budget(self, homework_module):
+        retry = homework_module.create_retry(3)
+        homework_module.REQUEST_BUDGET.retries = 1
+        try:
+            assert not retry.new(history=(None,)).is_exhausted()
+            assert retry.new(history=(None, None)).is_exhausted(), (
+                'Убедитесь, что повторы не выходят за бюджет цикла.'
+            )
+        finally:
+            homework_module.REQUEST_BUDGET.retries = None
+
+
+class TestDedupCache:
+
+    def test_ttl_and_lru(self, monkeypatch, homework_module):
+        now = [1000.0]
+        monkeypatch.setattr(homework_module.time, 'time', lambda: now[0])
+        cache = homework_module.DedupCache(maxsize=2, ttl=10)
+        cache.add('a')
+        cache.add('b')
+        assert 'a' in cache
+        cache.add('c')
+        assert 'b' not in cache, (
+            'Убедитесь, что вытесняется давно не встречавшийся отпечаток.'
+        )
+        assert 'a' in cache and 'c' in cache
+        now[0] += 10
+        assert 'a' not in cache, (
+            'Убедитесь, что отпечаток истекает через ttl секунд.'
+        )
+        assert len(cache) == 1
+
+    def test_alternating_messages_are_sent_once(self, monkeypatch,
+                                                homework_module):
+        responses = iter([
+            requests.RequestException('Something wrong'),
+            {'homeworks': [], 'current_date': 0},
+            requests.RequestException('Something wrong'),
+            {'homeworks': [], 'current_date': 0},
+        ])
+
+        def mock_get(*args, **kwargs):
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return utils.MockResponseGET(*args, random_timestamp=0,
+                                         http_status=HTTPStatus.OK,
+                                         data=response, **kwargs)
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        tenant = homework_module.Tenant('token', '1', timestamp=0)
+        sent = []
+        for _ in range(4):
+            homework_module.run_cycle(
+                tenant, lambda chat_id, text: sent.append(text) or True
+            )
+        assert len(sent) == 2, (
+            'Убедитесь, что чередующиеся повторные сообщения не '
+            'отправляются в Telegram повторно.'
+        )
+
+    def test_failed_delivery_is_not_remembered(self, homework_module):
+        tenant = homework_module.Tenant('token', '1')
+        message = homework_module.HOMEWORK_FOR_PERIOD
+        tenant.pending.append((None, homework_module.deliver(
+            tenant, lambda *args: False, [(None, message)]
+        )))
+        homework_module.settle(tenant)
+        assert message not in tenant.sent, (
+            'Убедитесь, что недоставленное сообщение можно отправить снова.'
+        )
+
+
+class TestMessageCatalog:
+
+    def test_locales_and_overrides(self, homework_module):
+        catalog = homework_module.MessageCatalog()
+        homework = homework_module.Homework(1, 'hw1', 'approved')
+        assert catalog.messages().status(homework) == (
+            homework_module.parse_status(homework)
+        )
+        english = catalog.messages('en').status(homework)
+        assert english.startswith('Review status of homework "hw1"')
+        custom = catalog.messages('ru', {'approved': 'Принято!'})
+        assert custom.status(homework).endswith('Принято!'), (
+            'Убедитесь, что подписка может переопределить текст вердикта.'
+        )
+        assert catalog.messages('ru', {'approved': 'Принято!'}) is custom, (
+            'Убедитесь, что подписки с одинаковыми настройками делят '
+            'шаблоны и кэш.'
+        )
+        with pytest.raises(ValueError):
+            catalog.messages('xx')
+
+    def test_rendering_is_memoized(self, homework_module):
+        messages = homework_module.MessageCatalog().messages()
+        homework = homework_module.Homework(1, 'hw1', 'rejected')
+        assert messages.status(homework) is messages.status(homework), (
+            'Убедитесь, что готовый текст сообщения переиспользуется.'
+        )
+
+    def test_subscription_locale(self, tmp_path, homework_module):
+        path = tmp_path / 'subscriptions.jsonl'
+        path.write_text(
+            '{"token": "a", "chat_id": 1, "locale": "en"}\n'
+            '{"token": "b", "chat_id": 2}\n',
+            encoding='utf-8'
+        )
+        english, russian = homework_module.load_subscriptions(str(path))
+        assert english.messages.empty != russian.messages.empty
+
+    def test_error_is_wrapped_once(self, homework_module):
+        message = homework_module.CATALOG.messages().error('сбой')
+        assert message == homework_module.BOT_ERROR.format('сбой')
+
+
+class TestLazyImports:
+
+    def test_heavy_clients_are_not_imported(self, homework_module):
+        modules = ('telegram', 'requests', 'asyncio', 'multiprocessing',
+                   'http.server', 'sqlite3', 'cProfile')
+        code = (
+            'import sys, homework; '
+            f'print(*[name in sys.modules for name in {modules}])'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True,
+            cwd=homework_module.os.path.dirname(homework_module.__file__),
+            timeout=5
+        )
+        assert result.stdout.split() == ['False'] * len(modules), (
+            'Убедитесь, что клиенты и модули отдельных режимов '
+            'импортируются при первом использовании, а не при импорте '
+            'модуля.'
+        )
+
+    def test_lazy_module_records_import_time(self, monkeypatch,
+                                             homework_module):
+        monkeypatch.setattr(homework_module, 'IMPORT_TIMES', {})
+        module = homework_module.LazyModule('json')
+        assert module.dumps([]) == '[]'
+        assert 'json' in homework_module.IMPORT_TIMES
+        assert 'json' in homework_module.startup_report()
+
+
+class TestReplay:
+
+    def test_record_and_replay(self, monkeypatch, tmp_path, random_timestamp,
+                               homework_module):
+        data = {
+            'homeworks': [
+                {'homework_name': 'hw1', 'status': 'approved'},
+                {'homework_name': 'hw2', 'status': 'reviewing'},
+            ],
+            'current_date': random_timestamp,
+        }
+        monkeypatch.setattr(
+            requests, 'get',
+            create_mock_response_get_with_custom_status_and_data(
+                random_timestamp, HTTPStatus.OK, data
+            )
+        )
+        path = str(tmp_path / 'capture.jsonl')
+        capture = homework_module.CaptureWriter(path)
+        monkeypatch.setattr(homework_module, 'CAPTURE', capture)
+        homework_module.get_api_answer(random_timestamp)
+        homework_module.get_api_answer(random_timestamp + 1)
+        capture.close()
+
+        records = list(homework_module.read_capture(path))
+        assert [record['from_date'] for record in records] == [
+            random_timestamp, random_timestamp + 1
+        ], 'Убедитесь, что записывается параметр from_date каждого запроса.'
+        assert records[0]['response'] == data
+        assert 'elapsed' in records[0]
+
+        sent = []
+        monkeypatch.setattr(homework_module, 'send_message',
+                            lambda bot, message: sent.append(message) or True)
+        result = homework_module.replay(path, utils.MockTelegramBot(),
+                                        speed=0, chat_rate=0)
+        assert result == (2, 2, 0), (
+            'Убедитесь, что воспроизведение проходит через StatusIndex и '
+            'повторные статусы не отправляются.'
+        )
+        assert sorted(sent) == sorted(
+            homework_module.parse_status(homework)
+            for homework in data['homeworks']
+        )
+        assert homework_module.SESSION is None, (
+            'После воспроизведения сессия API должна восстанавливаться.'
+        )
+
+    def test_replay_is_dry_run(self, tmp_path, homework_module):
+        path = tmp_path / 'capture.jsonl'
+        path.write_text(
+            '{"at": 1, "response": {"homeworks": [], "current_date": 1}}\n'
+            '{"at": 2, "response": {"homeworks": "broken"}}\n',
+            encoding='utf-8'
+        )
+        bot = homework_module.DryRunBot()
+        assert homework_module.replay(
+            str(path), bot, speed=0, chat_rate=0
+        ) == (2, 2, 1)
+        assert bot.sent == 2, (
+            'Убедитесь, что без REPLAY_LIVE сообщения только пишутся в лог.'
+        )
+
+    def test_dry_run_is_not_rate_limited(self, tmp_path, homework_module):
+        assert homework_module.TokenBucket(0).delay(time.monotonic()) == 0
+        path = tmp_path / 'capture.jsonl'
+        path.write_text(''.join(
+            '{"at": %d, "response": {"homeworks": [{"homework_name": "hw", '
+            '"status": "%s"}], "current_date": %d}}\n'
+            % (at, ('reviewing', 'approved')[at % 2], at)
+            for at in range(8)
+        ), encoding='utf-8')
+        bot = homework_module.DryRunBot()
+        started = time.monotonic()
+        assert homework_module.replay(
+            str(path), bot, speed=0, chat_rate=0, global_rate=0
+        ) == (8, 8, 0)
+        assert time.monotonic() - started < 1, (
+            'Убедитесь, что пробное воспроизведение не ждёт ограничений '
+            'частоты Telegram.'
+        )
+
+    def test_replay_keeps_tenants_apart(self, monkeypatch, tmp_path,
+                                        homework_module):
+        monkeypatch.setattr(homework_module, 'PRACTICUM_TOKEN', None)
+        response = {
+            'homeworks': [{'homework_name': 'hw1', 'status': 'approved'}],
+            'current_date': 1,
+        }
+        path = tmp_path / 'capture.jsonl'
+        path.write_text(''.join(
+            json.dumps({'at': at, 'tenant': tenant, 'response': response})
+            + '\n'
+            for at, tenant in ((1, '10:aaa'), (2, '20:bbb'), (3, '10:aaa'))
+        ), encoding='utf-8')
+        sent = []
+
+        class Bot:
+            def send_message(self, chat_id, text, **kwargs):
+                sent.append(chat_id)
+
+        assert homework_module.replay(
+            str(path), Bot(), speed=0, chat_rate=0
+        ) == (3, 2, 0)
+        assert sorted(sent) == ['10', '20'], (
+            'Убедитесь, что записи разных подписок воспроизводятся каждая '
+            'через своё состояние.'
+        )
+
+    def test_replay_of_empty_capture(self, tmp_path, homework_module):
+        path = tmp_path / 'capture.jsonl'
+        path.write_bytes(b'')
+        assert homework_module.replay(str(path), None) == (0, 0, 0)
+
+
+class TestFanOut:
+
+    def test_one_fetch_for_many_chats(self, monkeypatch, tmp_path,
+                                      random_timestamp, homework_module):
+        path = tmp_path / 'subscriptions.jsonl'
+        path.write_text('{"token": "shared", "chat_id": [1, 2, 3]}\n',
+                        encoding='utf-8')
+        tenants = homework_module.load_subscriptions(str(path))
+        assert len({tenant.feed for tenant in tenants}) == 1
+        requested = []
+        data = {
+            'homeworks': [{'homework_name': 'hw1', 'status': 'approved'}],
+            'current_date': random_timestamp,
+        }
+
+        def mock_get(*args, **kwargs):
+            requested.append(kwargs['params']['from_date'])
+            return utils.MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                http_status=HTTPStatus.OK, data=data, **kwargs
+            )
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        tenants[1].timestamp = 5
+        sent = []
+        homework_module.run_feed(
+            tenants, lambda chat_id, text: sent.append(chat_id) or True
+        )
+        assert requested == [5], (
+            'Убедитесь, что общий токен запрашивается один раз с самой '
+            'ранней меткой времени подписок.'
+        )
+        assert sorted(sent) == ['1', '2', '3'], (
+            'Убедитесь, что уведомление уходит в каждый чат подписки.'
+        )
+        assert all(
+            tenant.timestamp == random_timestamp for tenant in tenants
+        )
+
+    def test_shared_token_stays_on_one_shard(self, homework_module):
+        tenants = [
+            homework_module.Tenant(f'token{index % 5}', str(index))
+            for index in range(30)
+        ]
+        for shard in range(3):
+            assigned = homework_module.shard_tenants(tenants, shard,
+                                                     [True] * 3)
+            feeds = {tenant.feed for tenant in assigned}
+            assert all(
+                tenant in assigned
+                for tenant in tenants if tenant.feed in feeds
+            ), 'Подписки одного токена должны опрашиваться одним шардом.'
+
+    def test_engine_polls_feed_once(self, homework_module):
+        tenants = [
+            homework_module.Tenant('shared', '1'),
+            homework_module.Tenant('shared', '2'),
+            homework_module.Tenant('other', '3'),
+        ]
+        engine = homework_module.PollingEngine(utils.MockTelegramBot(), [])
+
+        engine.assign(tenants)
+        assert len(engine.wheel) == 2, (
+            'Убедитесь, что движок опрашивает каждый токен одной задачей.'
+        )
+
+    def test_errors_do_not_leak_token(self, monkeypatch, homework_module):
+        token = 'secret-practicum-token'
+        failures = [
+            requests.RequestException('Something wrong'),
+            HTTPStatus.INTERNAL_SERVER_ERROR,
+            {'code': 'not_authenticated'},
+        ]
+        sent = []
+        for failure in failures:
+            def mock_get(*args, failure=failure, **kwargs):
+                if isinstance(failure, Exception):
+                    raise failure
+                if isinstance(failure, dict):
+                    return utils.MockResponseGET(
+                        *args, random_timestamp=0, data=failure,
+                        http_status=HTTPStatus.OK, **kwargs
+                    )
+                return utils.MockResponseGET(
+                    *args, random_timestamp=0, http_status=failure, **kwargs
+                )
+
+            monkeypatch.setattr(requests, 'get', mock_get)
+            homework_module.run_feed(
+                [homework_module.Tenant(token, chat_id)
+                 for chat_id in ('student', 'mentor', 'group-channel')],
+                lambda chat_id, text: sent.append(text) or True
+            )
+        assert len(sent) == 9
+        assert not any(token in text for text in sent), (
+            'Убедитесь, что тексты ошибок не содержат токен Практикума.'
+        )
+
+
+class TestDigest:
+
+    def test_messages_are_coalesced_per_chat(self, homework_module):
+        sent = []
+        digest = homework_module.Digest(
+            lambda chat_id, text: sent.append((chat_id, text)) or True,
+            window=60
+        )
+        futures = [
+            digest.put('1', 'первое'),
+            digest.put('1', 'второе'),
+            digest.put('2', 'третье'),
+        ]
+        assert not sent and not any(future.done() for future in futures)
+        digest.flush()
+        assert sorted(sent) == [('1', 'первое\n\nвторое'), ('2', 'третье')], (
+            'Убедитесь, что сообщения одного чата собираются в одно.'
+        )
+        assert all(future.result() for future in futures)
+
+    def test_digest_is_capped(self, homework_module):
+        limit = homework_module.TELEGRAM_MESSAGE_LIMIT
+        items = [('x' * 1500, None) for _ in range(5)]
+        items.append(('y' * (limit + 10), None))
+        texts = [
+            text for text, _ in homework_module.Digest.chunks(items, limit)
+        ]
+        assert all(len(text) <= limit for text in texts), (
+            'Сводка не должна превышать длину сообщения Telegram.'
+        )
+        assert len(texts) == 4
+
+    def test_window_flushes_in_background(self, homework_module):
+        sent = threading.Event()
+        digest = homework_module.Digest(
+            lambda chat_id, text: sent.set() or True, window=0.05
+        ).start()
+        try:
+            future = digest.put('1', 'сообщение')
+            assert sent.wait(1), (
+                'Убедитесь, что сводка отправляется по истечении окна.'
+            )
+            assert future.result(timeout=1)
+        finally:
+            digest.stop()
+
+    def test_zero_window_sends_immediately(self, homework_module):
+        sent = []
+        digest = homework_module.Digest(
+            lambda chat_id, text: sent.append(text) or True, window=0
+        )
+        assert digest.put('1', 'сообщение').result()
+        assert sent == ['сообщение']
+
+
+class TestProfiling:
+
+    def test_stage_hooks_receive_timings(self, monkeypatch, homework_module):
+        timings = []
+        monkeypatch.setattr(
+            homework_module, 'STAGE_HOOKS',
+            [lambda name, wall, cpu: timings.append((name, wall, cpu))]
+        )
+        with homework_module.stage('parse_status'):
+            sum(range(10000))
+        (name, wall, cpu), = timings
+        assert name == 'parse_status'
+        assert wall > 0 and cpu >= 0
+
+    def test_stage_without_hooks(self, monkeypatch, homework_module):
+        monkeypatch.setattr(homework_module, 'STAGE_HOOKS', [])
+        assert homework_module.stage('sleep') is homework_module.NO_STAGE, (
+            'Без хуков этап не должен замеряться.'
+        )
+
+    def test_cycle_stages_are_recorded(self, monkeypatch, homework_module):
+        stages = []
+        monkeypatch.setattr(homework_module, 'STAGE_HOOKS',
+                            [lambda name, wall, cpu: stages.append(name)])
+        monkeypatch.setattr(
+            requests, 'get',
+            create_mock_response_get_with_custom_status_and_data(
+                1, HTTPStatus.OK, {
+                    'homeworks': [
+                        {'homework_name': 'hw1', 'status': 'approved'}
+                    ],
+                    'current_date': 1,
+                }
+            )
+        )
+        homework_module.run_cycle(homework_module.Tenant('token', '1', 0),
+                                  lambda *args: True)
+        assert stages == ['get_api_answer', 'check_response',
+                          'parse_status'], (
+            'Убедитесь, что этапы цикла замеряются.'
+        )
+
+    def test_profile_window(self, tmp_path, homework_module):
+        profiler = homework_module.Profiler(cycles=2,
+                                            directory=str(tmp_path))
+        with profiler.cycle():
+            pass
+        assert profiler.profile is None, (
+            'Без запроса профилирование не должно включаться.'
+        )
+        profiler.request()
+        for _ in range(2):
+            with profiler.cycle():
+                sum(range(1000))
+        assert profiler.profile is None
+        dumps = list(tmp_path.glob('*.pstats'))
+        assert len(dumps) == 1, (
+            'Убедитесь, что после окна профилирования сохраняется pstats.'
+        )
+
+
+class TestTimingWheel:
+
+    def test_schedule_and_cancel(self, homework_module):
+        wheel = homework_module.TimingWheel(tick=1, size=8, jitter=0)
+        wheel.schedule('a', 3)
+        wheel.schedule('b', 20)
+        wheel.schedule('c', 3)
+        wheel.cancel('c')
+        due = {}
+        for tick in range(1, 25):
+            for key in wheel.advance():
+                due[key] = tick
+        assert due == {'a': 3, 'b': 20}, (
+            'Убедитесь, что ключ срабатывает через заданное число тиков, '
+            'в том числе дальше одного оборота колеса.'
+        )
+        assert len(wheel) == 0
+
+    def test_jitter_spreads_polls(self, homework_module):
+        wheel = homework_module.TimingWheel(tick=1, size=1024, jitter=0.1)
+        for key in range(1000):
+            wheel.schedule(key, 600)
+        busy = [slot for slot in wheel.slots if slot]
+        assert len(busy) > 100, (
+            'Убедитесь, что опросы с одним периодом расходятся по тикам.'
+        )
+        assert max(len(slot) for slot in busy) < 50
+
+    def test_engine_polls_due_feeds(self, monkeypatch, homework_module):
+        polled = []
+        engine = homework_module.PollingEngine(
+            utils.MockTelegramBot(), [homework_module.Tenant('token', '1')],
+            period=0.05
+        )
+        engine.wheel = homework_module.TimingWheel(tick=0.01, jitter=0)
+
+        async def poll_once(tenants):
+            polled.append(tenants[0].chat_id)
+            engine.stop()
+
+        monkeypatch.setattr(engine, 'poll_once', poll_once)
+        asyncio.run(engine.run())
+        assert polled == ['1'], (
+            'Убедитесь, что движок запускает опрос, когда срок на колесе '
+            'наступил.'
+        )
+
+
+class TestErrorAggregation:
+
+    def test_quiet_period_doubles(self, monkeypatch, homework_module):
+        now = [1000.0]
+        monkeypatch.setattr(homework_module.time, 'monotonic',
+                            lambda: now[0])
+        errors = homework_module.ErrorAggregator(quiet=10, max_quiet=40)
+        notified = []
+        for _ in range(100):
+            if errors.record(ConnectionError('сбой')):
+                notified.append(now[0] - 1000)
+            now[0] += 1
+        assert notified == [0, 10, 30, 70], (
+            'Убедитесь, что период тишины удваивается до max_quiet.'
+        )
+        assert errors.record(ValueError('другая')), (
+            'Убедитесь, что ошибки разных типов группируются отдельно.'
+        )
+
+    def test_summary_counts(self, monkeypatch, homework_module):
+        errors = homework_module.ErrorAggregator(summary_period=0)
+        for _ in range(3):
+            errors.record(ConnectionError('сбой'))
+        text = errors.summary()
+        assert 'ConnectionError' in text and '3 раз' in text
+        assert errors.summary() is None, (
+            'Убедитесь, что сводка не повторяется без новых ошибок.'
+        )
+
+    def test_errors_go_to_operator(self, monkeypatch, homework_module):
+        def mock_get(*args, **kwargs):
+            raise requests.RequestException('Something wrong')
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        monkeypatch.setattr(homework_module, 'OPERATOR_CHAT_ID', 'operator')
+        errors = homework_module.ErrorAggregator(summary_period=60)
+        errors.summarized_at -= 60
+        monkeypatch.setattr(homework_module, 'ERRORS', errors)
+        sent = []
+        tenant = homework_module.Tenant('token', '1', timestamp=0)
+        for _ in range(3):
+            homework_module.run_cycle(
+                tenant, lambda chat_id, text: sent.append(chat_id) or True
+            )
+        assert '1' not in sent, (
+            'При заданном OPERATOR_CHAT_ID ошибки не отправляются '
+            'в чат студента.'
+        )
+        assert sent == ['operator'], (
+            'Убедитесь, что оператору уходит одна сводка за период.'
+        )
+
+    def test_summary_is_redacted(self, monkeypatch, homework_module):
+        def mock_get(*args, **kwargs):
+            return utils.MockResponseGET(
+                *args, random_timestamp=0,
+                http_status=HTTPStatus.INTERNAL_SERVER_ERROR, **kwargs
+            )
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        monkeypatch.setattr(homework_module, 'OPERATOR_CHAT_ID', 'operator')
+        monkeypatch.setattr(homework_module, 'ERRORS',
+                            homework_module.ErrorAggregator(summary_period=0))
+        sent = {}
+        homework_module.run_cycle(
+            homework_module.Tenant('secret-practicum-token', '1'),
+            lambda chat_id, text: sent.setdefault(chat_id, text)
+        )
+        text = sent['operator']
+        assert 'StatusCodeError 500' in text
+        assert 'secret-practicum-token' not in text, (
+            'Убедитесь, что сводка оператору не содержит токен подписки.'
+        )
+
+
+class TestTimeouts:
+
+    def test_request_has_timeouts(self, monkeypatch, random_timestamp,
+                                  homework_module):
+        timeouts = []
+
+        def mock_get(*args, **kwargs):
+            timeouts.append(kwargs.get('timeout'))
+            return utils.MockResponseGET(*args,
+                                         random_timestamp=random_timestamp,
+                                         **kwargs)
+
+        monkeypatch.setattr(requests, 'get', mock_get)
+        homework_module.get_api_answer(random_timestamp)
+        assert timeouts == [(homework_module.HTTP_CONNECT_TIMEOUT,
+                             homework_module.HTTP_READ_TIMEOUT)], (
+            'Убедитесь, что запрос к API ограничен таймаутами соединения '
+            'и чтения.'
+        )
+
+    def test_send_has_timeout(self, homework_module):
+        calls = []
+
+        class Bot:
+            def send_message(self, *args, **kwargs):
+                calls.append(kwargs)
+
+        assert homework_module.send_to_chat(Bot(), '1', 'сообщение')
+        assert calls == [{'timeout': homework_module.TELEGRAM_TIMEOUT}]
+
+    def test_watchdog_abandons_hung_cycle(self, homework_module):
+        release = threading.Event()
+        started = []
+        counter = homework_module.CYCLE_TIMEOUTS
+        before = counter.values.get((), 0)
+        try:
+            assert homework_module.watchdog(
+                0.05, 'tenant', release.wait, 1
+            ) is None
+            assert homework_module.watchdog(
+                0.05, 'tenant', started.append, 1
+            ) is None
+            assert not started, (
+                'Пока брошенный цикл не закончился, новый не запускается.'
+            )
+        finally:
+            release.set()
+        assert counter.values[()] == before + 1, (
+            'Убедитесь, что зависший цикл учитывается в метрике.'
+        )
+        assert homework_module.watchdog(1, 'tenant', lambda: 42) == 42
+        with pytest.raises(ValueError):
+            homework_module.watchdog(1, 'tenant', int, 'x')
+
+    def test_engine_keeps_slot_of_hung_poll(self, monkeypatch,
+                                            homework_module):
+        release = threading.Event()
+        monkeypatch.setattr(homework_module, 'run_feed',
+                            lambda *args: release.wait(1))
+        engine = homework_module.PollingEngine(utils.MockTelegramBot(), [],
+                                               cycle_timeout=0.05)
+        counter = homework_module.CYCLE_TIMEOUTS
+        before = counter.values.get((), 0)
+
+        async def poll():
+            engine.semaphore = asyncio.Semaphore(1)
+            task = asyncio.ensure_future(
+                engine.poll_once([homework_module.Tenant('token', '1')])
+            )
+            await asyncio.sleep(0.2)
+            hung = engine.semaphore.locked() and not task.done()
+            release.set()
+            await task
+            return hung, engine.semaphore.locked()
+
+        try:
+            hung, locked = asyncio.run(poll())
+        finally:
+            release.set()
+            engine.executor.shutdown()
+        assert hung, (
+            'Убедитесь, что зависший поток держит слот движка, пока не '
+            'закончит.'
+        )
+        assert not locked, 'После завершения потока слот освобождается.'
+        assert counter.values[()] == before + 1
+
+    def test_cycle_timeout_covers_request(self, homework_module):
+        assert homework_module.CYCLE_TIMEOUT >= (
+            homework_module.HTTP_REQUEST_LIMIT
+        ), 'Сторож не должен бросать медленный, но рабочий запрос.'
+        with pytest.raises(ValueError):
+            homework_module.check_cycle_timeout(10, 20)
+
+
 if __name__ == '__main__':
     pytest.main()